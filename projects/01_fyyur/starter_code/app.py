@@ -2,10 +2,19 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import io
+import hashlib
 import json
+import re
+import sys
+import time
+import click
 import dateutil.parser
+import jinja2
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context, session, make_response, g, has_app_context
 from flask_migrate import Migrate
 from config import *
 from flask_moment import Moment
@@ -14,7 +23,19 @@ import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import chain, groupby, islice
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from functools import lru_cache, wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from assets import asset_tags, build_assets, load_manifest, send_asset
+from cache import make_cache
+from metrics import InstrumentedQueuePool, RequestMetrics, pool_metrics, render_metrics
+from routing import RoutingSQLAlchemy, RoutingSession, reading_primary, remember_writes, replica_binds, replica_reads
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,7 +43,7 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
 
 # TODO: connect to a local postgresql database
@@ -30,12 +51,66 @@ migrate = Migrate(app, db)
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+def engine_options(config):
+  # pool settings from config.py; SQLite keeps SQLAlchemy's own pooling
+  if not config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+    return {}
+  options = {
+    'poolclass': InstrumentedQueuePool,
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if config['DB_STATEMENT_TIMEOUT']:
+    options['connect_args'] = {'options': '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT'])}
+  return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config['SQLALCHEMY_REPLICA_URIS'])
+remember_writes(RoutingSession, app)
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+def trigram_index(table, column):
+    # GIN trigram index backing case-insensitive '%term%' searches (needs pg_trgm)
+    return db.Index('ix_{}_{}_trgm'.format(table.lower(), column), column,
+                    postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+    __table_args__ = (
+        trigram_index('Genre', 'name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+
+# genre -> venues/artists lookup tables. the (genre_id, ...) primary keys are
+# the inverted index used by the genre filters; the second index serves the
+# reverse lookup when loading an entity's genres.
+venue_genres = db.Table('venue_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_venue_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_artist_id', 'artist_id'),
+)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        trigram_index('Venue', 'name'),
+        trigram_index('Venue', 'city'),
+        db.Index('ix_venue_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -46,58 +121,539 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     # website = db.Column(db.String(200))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by=Genre.name, passive_deletes=True)
     # seeking_talent = db.Column(db.Boolean)
     # seeking_description = db.Column(db.String(1000))
-    Show = db.relationship('Show', backref='venue', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    Show = db.relationship('Show', backref='venue', lazy=True, passive_deletes=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        trigram_index('Artist', 'name'),
+        trigram_index('Artist', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by=Genre.name, passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     # seeking_venue = db.Column(db.Boolean)
     # seeking_description = db.Column(db.String(1000))
-    Show = db.relationship('Show', backref='artist', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    Show = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def show_end_time(start_time):
+  return start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+
+def default_end_time(context):
+  return show_end_time(context.get_current_parameters()['start_time'])
+
 class Show(db.Model):
   __tablename__ = 'Show'
+  # on Postgres the venue_booking_excl/artist_booking_excl exclusion
+  # constraints (see migrations) reject overlapping [start_time, end_time)
+  # bookings for one venue or artist; their GiST indexes also serve
+  # booking_conflicts() and the /shows/availability check
+  __table_args__ = (
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   start_time = db.Column(db.DateTime)
+  end_time = db.Column(db.DateTime, default=default_end_time)
   
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+def touch(mapper, connection, target):
+  # before_update also fires for genre-only changes, which onupdate= would miss
+  target.updated_at = datetime.utcnow()
+
+for model in (Venue, Artist, Show):
+  event.listen(model, 'before_update', touch)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# rendered pages keyed by '<page>:<entity id>:<query string>', e.g. 'venue:3:'
+page_cache = make_cache(app.config)
+
+def page_cache_prefixes(target):
+  # the cached pages that display data from a Venue, Artist or Show row
+  if isinstance(target, Venue):
+    return ['venues:', 'venue:{}:'.format(target.id), 'shows:', 'artist:']
+  if isinstance(target, Artist):
+    return ['artists:', 'artist:{}:'.format(target.id), 'shows:', 'venue:']
+  # a show may have moved between venues or artists, so drop all detail pages
+  return ['venues:', 'shows:', 'venue:', 'artist:']
+
+def queue_page_invalidation(mapper, connection, target):
+  # pages are dropped once the transaction commits, not when the change is
+  # flushed, so a rollback drops nothing. a miss that read the old rows
+  # before the commit may finish after the drop; cached_page() passes the
+  # cache generation it started with, and set() then discards that page.
+  session = object_session(target)
+  session.info.setdefault('page_cache_prefixes', set()).update(page_cache_prefixes(target))
+
+for model in (Venue, Artist, Show):
+  for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(model, event_name, queue_page_invalidation)
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def queue_bulk_page_invalidation(context):
+  # Query.update()/delete() do not report the affected rows, so every page goes
+  context.query.session.info.setdefault('page_cache_prefixes', set()).add('')
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_pages(session):
+  for prefix in session.info.pop('page_cache_prefixes', ()):
+    page_cache.delete_prefix(prefix)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_page_invalidations(session):
+  session.info.pop('page_cache_prefixes', None)
+
+def cache_stream(key, chunks, generation):
+  # passes a streamed body through and caches it once fully sent
+  body = []
+  for chunk in chunks:
+    body.append(chunk)
+    yield chunk
+  page_cache.set(key, b''.join(body), generation)
+
+def cached_page(page, id_arg=None):
+  # serves a GET view from the page cache. requests with pending flash
+  # messages bypass the cache, since those render into the page, and so do
+  # browsers that just wrote, which a page cached from a lagging replica
+  # could otherwise show the old data. misses are rendered from the
+  # primary: a replica still behind the commit that dropped a page would
+  # otherwise put the old rows back for the whole CACHE_TIMEOUT.
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      if '_flashes' in session or reading_primary():
+        return view(**kwargs)
+      key = '{}:{}:{}'.format(page, kwargs.get(id_arg, ''), request.query_string.decode())
+      body = page_cache.get(key)
+      if body is not None:
+        return Response(body, mimetype='text/html')
+      g.use_replica = False
+      # read before any row is, so a page drop during rendering is noticed
+      generation = page_cache.generation(key)
+      response = make_response(view(**kwargs))
+      if response.status_code == 200:
+        if response.is_streamed:
+          response.response = cache_stream(key, response.iter_encoded(), generation)
+        else:
+          page_cache.set(key, response.get_data(), generation)
+      return response
+    return wrapper
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Instrumentation.
+#
+# Every request gets wall time, template render time, SQL statement count
+# and SQL time, written as one JSON log line and aggregated for /metrics.
+# Streamed pages are measured until the last chunk has been sent.
+#----------------------------------------------------------------------------#
+
+request_metrics = RequestMetrics()
+
+request_log = logging.getLogger('fyyur.requests')
+request_log.propagate = False
+request_log.setLevel(logging.INFO)
+request_log_handler = FileHandler(REQUEST_LOG_FILE) if REQUEST_LOG_FILE else logging.StreamHandler()
+request_log_handler.setFormatter(Formatter('%(message)s'))
+request_log.addHandler(request_log_handler)
+
+def request_stats():
+  # counters of the current request, None outside one (CLI, shell)
+  return g.get('request_stats') if has_app_context() else None
+
+class TimedTemplate(jinja2.Template):
+  # adds the time spent rendering to the current request, chunk by chunk for
+  # streamed templates so time spent waiting on the client is not counted
+
+  def render(self, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return super(TimedTemplate, self).render(*args, **kwargs)
+    finally:
+      add_render_time(time.perf_counter() - start)
+
+  def generate(self, *args, **kwargs):
+    chunks = super(TimedTemplate, self).generate(*args, **kwargs)
+    while True:
+      start = time.perf_counter()
+      try:
+        chunk = next(chunks)
+      except StopIteration:
+        return
+      finally:
+        add_render_time(time.perf_counter() - start)
+      yield chunk
+
+def add_render_time(elapsed):
+  stats = request_stats()
+  if stats is not None:
+    stats['render_time'] += elapsed
+
+app.jinja_env.template_class = TimedTemplate
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+  elapsed = time.perf_counter() - conn.info['query_started'].pop()
+  stats = request_stats()
+  if stats is not None:
+    stats['queries'] += 1
+    stats['sql_time'] += elapsed
+
+@app.before_request
+def start_request_timer():
+  g.request_stats = {'started': time.perf_counter(), 'render_time': 0.0, 'queries': 0, 'sql_time': 0.0}
+
+@app.after_request
+def log_request(response):
+  stats = g.get('request_stats')
+  if stats is not None:
+    # a streamed body is still to be rendered; call_on_close runs after it
+    endpoint, method, path = request.endpoint or 'unknown', request.method, request.full_path.rstrip('?')
+    response.call_on_close(lambda: finish_request(stats, endpoint, method, path, response.status_code))
+  return response
+
+def finish_request(stats, endpoint, method, path, status):
+  duration = time.perf_counter() - stats['started']
+  flagged = stats['queries'] > app.config['SQL_QUERY_WARN_THRESHOLD']
+  request_metrics.observe(endpoint, status, duration, stats['render_time'], stats['queries'],
+                          stats['sql_time'], flagged)
+  request_log.log(logging.WARNING if flagged else logging.INFO, json.dumps({
+    'method': method,
+    'path': path,
+    'endpoint': endpoint,
+    'status': status,
+    'duration_ms': round(duration * 1000, 2),
+    'render_ms': round(stats['render_time'] * 1000, 2),
+    'sql_queries': stats['queries'],
+    'sql_ms': round(stats['sql_time'] * 1000, 2),
+    'query_threshold_exceeded': flagged,
+  }))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  # value = datetime.strftime(value)
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def compile_datetime_format(format, locale):
+  # babel pattern and locale are parsed once per (format, locale)
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=DATETIME_FILTER_CACHE_SIZE)
+def render_datetime(date, format, locale):
+  pattern, locale = compile_datetime_format(format, locale)
+  return pattern.apply(date, locale)
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  # datetime objects from the database are used as is; strings are parsed
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return render_datetime(value, format, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def get_or_create_genres(names):
+  # Genre rows for the given names, creating the missing ones
+  names = set(names)
+  genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+  missing = names - set(genre.name for genre in genres)
+  for name in missing:
+    genre = Genre(name=name)
+    db.session.add(genre)
+    genres.append(genre)
+  if missing:
+    db.session.flush()
+  return genres
+
+def filter_by_genre(query, model, genre):
+  # joins through the (genre_id, entity_id) primary key of the lookup table
+  links = venue_genres if model is Venue else artist_genres
+  fk = links.c.venue_id if model is Venue else links.c.artist_id
+  return query.join(links, fk == model.id).join(Genre, Genre.id == links.c.genre_id).filter(Genre.name == genre)
+
+def venue_areas_query(genre=None, city=None, state=None):
+  # one row per venue with its upcoming show count, aggregated by the database.
+  # the outer join keeps venues without upcoming shows (count 0).
+  query = db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      db.func.count(Show.id).label('num_upcoming_shows')
+    ).outerjoin(Show, db.and_(
+      Show.venue_id == Venue.id,
+      Show.start_time > db.func.now()
+    ))
+  if genre:
+    query = filter_by_genre(query, Venue, genre)
+  if city:
+    query = query.filter(Venue.city == city)
+  if state:
+    query = query.filter(Venue.state == state)
+  return query.group_by(Venue.id).order_by(Venue.state, Venue.city, Venue.name)
+
+def get_venue_areas(genre=None, city=None, state=None):
+  # groups the rows of venue_areas_query() by (city, state); rows arrive
+  # ordered by area so this is a single pass over one result set.
+  areas = []
+  query = venue_areas_query(genre, city, state)
+  for (area_city, area_state), rows in groupby(query, key=lambda row: (row.city, row.state)):
+    areas.append({
+      'city': area_city.capitalize(),
+      'state': area_state,
+      'venues': [{
+        'id': row.id,
+        'name': row.name,
+        'num_upcoming_shows': row.num_upcoming_shows
+      } for row in rows]
+    })
+  return areas
+
+def artists_query(genre=None):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = filter_by_genre(query, Artist, genre)
+  return query.order_by(Artist.name)
+
+def like_pattern(term):
+  # '%term%' with the LIKE wildcards in the user's input escaped
+  term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return '%' + term + '%'
+
+def search_query(model, search_term):
+  # ranked, case-insensitive partial match on name, city and genres.
+  # the matching ids are a UNION of three ILIKE '%term%' lookups, each
+  # served by the trigram index on the name, city or Genre.name column
+  # (an OR with a genre EXISTS subplan in it would scan the whole table);
+  # similarity() ranks the hits. the upcoming show count and the total
+  # number of hits come from the same query.
+  pattern = like_pattern(search_term)
+  fk = Show.venue_id if model is Venue else Show.artist_id
+  links = venue_genres if model is Venue else artist_genres
+  link_fk = links.c.venue_id if model is Venue else links.c.artist_id
+  matching_ids = db.union(
+    db.select([model.id]).where(model.name.ilike(pattern, escape='\\')),
+    db.select([model.id]).where(model.city.ilike(pattern, escape='\\')),
+    db.select([link_fk])
+      .select_from(links.join(Genre, Genre.id == links.c.genre_id))
+      .where(Genre.name.ilike(pattern, escape='\\'))
+  )
+  rank = db.func.greatest(
+    db.func.similarity(model.name, search_term),
+    db.func.similarity(model.city, search_term)
+  )
+  return db.session.query(
+      model.id,
+      model.name,
+      db.func.count(Show.id).label('num_upcoming_shows'),
+      db.func.count().over().label('total')
+    ).outerjoin(Show, db.and_(
+      fk == model.id,
+      Show.start_time > db.func.now()
+    )).filter(model.id.in_(matching_ids)) \
+    .group_by(model.id).order_by(rank.desc(), model.name)
+
+def search(model, search_term, page=1):
+  # a page below 1 would be a negative OFFSET, which the database rejects
+  if page < 1:
+    abort(400)
+  per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+  rows = search_query(model, search_term).limit(per_page).offset((page - 1) * per_page).all()
+  count = rows[0].total if rows else 0
+  return {
+    'count': count,
+    'page': page,
+    'has_prev': page > 1,
+    'has_next': page * per_page < count,
+    'data': [{
+      'id': row.id,
+      'name': row.name,
+      'num_upcoming_shows': row.num_upcoming_shows
+    } for row in rows]
+  }
+
+def shows_query(after=None, include_past=False):
+  # shows in (start_time, id) order with their venue and artist fields from
+  # one join. `after` is the (start_time, id) of the last show of the previous
+  # page; rows are fetched with a keyset seek instead of an OFFSET scan.
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id
+    ).join(Artist, Show.artist_id == Artist.id)
+  if not include_past:
+    query = query.filter(Show.start_time >= db.func.now())
+  if after is not None:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > db.tuple_(*after))
+  return query.order_by(Show.start_time, Show.id)
+
+def show_cursor(row):
+  return '{}_{}'.format(row.start_time.isoformat(), row.id)
+
+def parse_show_cursor(cursor):
+  if not cursor:
+    return None
+  try:
+    start_time, show_id = cursor.rsplit('_', 1)
+    start_time, show_id = dateutil.parser.parse(start_time), int(show_id)
+  except (ValueError, OverflowError):
+    # OverflowError: a year too large for datetime, e.g. 99999999999999999999999
+    abort(400)
+  # shows.id is a 4-byte integer; a larger id would fail in the database
+  if not -2 ** 31 <= show_id < 2 ** 31:
+    abort(400)
+  return start_time, show_id
+
+def get_shows_page(after=None, include_past=False):
+  # fetches one row past the page size to know whether a next page exists
+  per_page = app.config['SHOWS_PER_PAGE']
+  rows = shows_query(after, include_past).limit(per_page + 1).all()
+  next_cursor = show_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+  return rows[:per_page], next_cursor
+
+# SQLSTATE raised by the venue_booking_excl/artist_booking_excl constraints
+EXCLUSION_VIOLATION = '23P01'
+
+def booking_overlap(start_time, end_time):
+  # the expression and predicate of the exclusion constraints, so their
+  # partial GiST indexes apply
+  return db.and_(
+    Show.start_time.isnot(None), Show.end_time.isnot(None),
+    db.func.tsrange(Show.start_time, Show.end_time).op('&&')(db.func.tsrange(start_time, end_time)))
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time):
+  # (venue_booked, artist_booked) for a candidate show
+  overlapping = booking_overlap(start_time, end_time)
+  return db.session.query(
+    db.exists().where(db.and_(Show.venue_id == venue_id, overlapping)),
+    db.exists().where(db.and_(Show.artist_id == artist_id, overlapping)),
+  ).one()
+
+AVAILABILITY_SQL = db.text("""
+  SELECT
+    NOT EXISTS (SELECT 1 FROM "Show" WHERE "Show".venue_id = slot.venue_id
+      AND "Show".start_time IS NOT NULL AND "Show".end_time IS NOT NULL
+      AND tsrange("Show".start_time, "Show".end_time) && tsrange(slot.start_time, slot.end_time)),
+    NOT EXISTS (SELECT 1 FROM "Show" WHERE "Show".artist_id = slot.artist_id
+      AND "Show".start_time IS NOT NULL AND "Show".end_time IS NOT NULL
+      AND tsrange("Show".start_time, "Show".end_time) && tsrange(slot.start_time, slot.end_time))
+  FROM unnest(CAST(:venue_ids AS integer[]), CAST(:artist_ids AS integer[]),
+              CAST(:start_times AS timestamp[]), CAST(:end_times AS timestamp[]))
+       WITH ORDINALITY AS slot(venue_id, artist_id, start_time, end_time, position)
+  ORDER BY slot.position
+""")
+
+def check_availability(slots):
+  # checks every (venue_id, artist_id, start_time) slot against the existing
+  # bookings in one round trip: the slots travel as four arrays and each one
+  # is two index probes. slots are not checked against each other.
+  rows = db.session.execute(AVAILABILITY_SQL, {
+    'venue_ids': [slot['venue_id'] for slot in slots],
+    'artist_ids': [slot['artist_id'] for slot in slots],
+    'start_times': [slot['start_time'] for slot in slots],
+    'end_times': [slot['end_time'] for slot in slots],
+  }).fetchall()
+  return [dict(slot, venue_available=venue_free, artist_available=artist_free,
+               available=venue_free and artist_free)
+          for slot, (venue_free, artist_free) in zip(slots, rows)]
+
+def entity_shows_query(fk, counterpart):
+  # all shows of one venue or artist joined with the other side of the show
+  # in a single query. the database flags each show as upcoming or past and
+  # counts both buckets with a window function.
+  prefix = counterpart.__tablename__.lower()
+  upcoming = Show.start_time > db.func.now()
+  return db.session.query(
+      Show.start_time,
+      counterpart.id.label(prefix + '_id'),
+      counterpart.name.label(prefix + '_name'),
+      counterpart.image_link.label(prefix + '_image_link'),
+      upcoming.label('upcoming'),
+      db.func.count().over(partition_by=upcoming).label('bucket_count')
+    ).join(counterpart, getattr(Show, prefix + '_id') == counterpart.id
+    ).filter(fk).order_by(Show.start_time)
+
+def get_entity_detail(entity, shows):
+  data = {column.name: getattr(entity, column.name) for column in entity.__table__.columns}
+  data.update({
+    'genres': [genre.name for genre in entity.genres],
+    'past_shows': [],
+    'upcoming_shows': [],
+    'past_shows_count': 0,
+    'upcoming_shows_count': 0
+  })
+  for row in shows:
+    show = row._asdict()
+    bucket = 'upcoming' if show.pop('upcoming') else 'past'
+    data[bucket + '_shows_count'] = show.pop('bucket_count')
+    data[bucket + '_shows'].append(show)
+  # most recent past show first
+  data['past_shows'].reverse()
+  return data
+
+def get_venue_detail(venue_id):
+  venue = Venue.query.get_or_404(venue_id)
+  return get_entity_detail(venue, entity_shows_query(Show.venue_id == venue_id, Artist))
+
+def get_artist_detail(artist_id):
+  artist = Artist.query.get_or_404(artist_id)
+  return get_entity_detail(artist, entity_shows_query(Show.artist_id == artist_id, Venue))
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def stream_template(template_name, **context):
+  # renders a template in chunks so the first rows reach the client before
+  # the whole page is built
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return stream
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -107,21 +663,11 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@replica_reads
+@cached_page('venues')
 def venues():
-  data = []
-  cities = db.session.query(Venue.city, Venue.state).distinct(Venue.city, Venue.state).all()
-  for city in cities:
-    venues = db.session.query(Venue).filter(Venue.city == city[0]).filter(Venue.state == city[1]).all()
-    # for venue in venues:
-    #   venue.num_upcoming_shows = len(db.session.query(Show).filter(Show.venue_id == Venue.id).all())
-    #   print(venue.num_upcoming_shows)
-    data.append({
-      'city': city[0].capitalize(),
-      'state': city[1],
-      'venues': venues
-    })
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
+  # optional ?genre=Jazz&city=New York&state=NY filters
+  data = get_venue_areas(request.args.get('genre'), request.args.get('city'), request.args.get('state'))
   # data=[{
   #   "city": "San Francisco",
   #   "state": "CA",
@@ -143,28 +689,13 @@ def venues():
   #     "num_upcoming_shows": 0,
   #   }]
   # }]
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data, genres=Genre.query.order_by(Genre.name).all())
 
 @app.route('/venues/search', methods=['POST'])
+@replica_reads
 def search_venues():
-  search_term = request.form.get('search_term')
-  venues = db.session.query(Venue).filter(Venue.name.contains(search_term)).all()
-  data = []
-  for venue in venues:
-        # # Filter upcoming shows
-        # upcoming_shows = Show.query.filter_by(venue_id=venue.id).filter(
-        #     Show.start_time > datetime.utcnow().isoformat()).all()
-    res_result = {
-      "id": venue.id,
-      "name": venue.name,
-      #"num_upcoming_shows": upcoming_shows,
-    }
-    data.append(res_result)
-  response = {
-    "count": len(venues),
-    "data": data
-  } 
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  search_term = request.form.get('search_term', '')
+  response = search(Venue, search_term, request.form.get('page', 1, type=int))
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   # response={
@@ -178,6 +709,8 @@ def search_venues():
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@replica_reads
+@cached_page('venue', 'venue_id')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
@@ -259,8 +792,8 @@ def show_venue(venue_id):
   #   "upcoming_shows_count": 1,
   # }
   #data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  venue = Venue.query.get(venue_id)
-  return render_template('pages/show_venue.html', venue=venue)
+  data = get_venue_detail(venue_id)
+  return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -276,19 +809,16 @@ def create_venue_submission():
   # TODO: modify data to be the data object returned from db insertion
   # form = VenueForm()
   # error=False
-  genres=[]
-  genres.append(request.form.getlist("genres"))
   new_venue = {
     "name": request.form["name"], #.get("name"),
     "city": request.form["city"], #.get("city"), 
     "state": request.form["state"], #.get("state"), 
     "address": request.form["address"], #.get("address"), 
     "phone": request.form["phone"], #.get("phone"),
-    "genres": genres, #request.form["genres"]#.get("genres"),
     "facebook_link": request.form["facebook_link"] #.get("facebook_link")
   }
   try:
-    venue=Venue(name=new_venue["name"], city=new_venue["city"], state=new_venue["state"], address=new_venue["address"], phone=new_venue["phone"], genres=new_venue["genres"], facebook_link=new_venue["facebook_link"])
+    venue=Venue(name=new_venue["name"], city=new_venue["city"], state=new_venue["state"], address=new_venue["address"], phone=new_venue["phone"], genres=get_or_create_genres(request.form.getlist("genres")), facebook_link=new_venue["facebook_link"])
     db.session.add(venue)
     db.session.commit()
     flash('Venue ' + request.form['name'] + ' was successfully listed.')
@@ -330,32 +860,48 @@ def create_venue_submission():
   # # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   # return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
+def delete_entities(model, ids):
+  # a single DELETE statement in one transaction; the database removes the
+  # related shows through the ON DELETE CASCADE foreign keys
   try:
-    Show.query.filter_by(venue_id=venue_id).delete()
-    venue=Venue.query.get(venue_id)
-    db.session.delete(venue)
+    deleted = model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
     db.session.commit()
   except:
     db.session.rollback()
-    print(sys.exc_info())
+    app.logger.exception('could not delete %s %s', model.__tablename__, ids)
+    abort(500)
   finally:
     db.session.close()
-  return None
+  return deleted
+
+def requested_ids():
+  # {"ids": [1, 2, 3]} body of the bulk delete endpoints; true and false
+  # are ints to isinstance, so the type is checked exactly
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict):
+    abort(400)
+  ids = body.get('ids')
+  if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+    abort(400)
+  return ids
+
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  if not delete_entities(Venue, [venue_id]):
+    abort(404)
+  return jsonify({'success': True, 'deleted': venue_id})
 
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  #return None
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+  return jsonify({'success': True, 'deleted': delete_entities(Venue, requested_ids())})
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@replica_reads
+@cached_page('artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
+  # optional ?genre=Jazz filter
   # data=[{
   #   "id": 4,
   #   "name": "Guns N Petals",
@@ -367,36 +913,15 @@ def artists():
   #   "name": "The Wild Sax Band",
   # }]
 
-  data = []
-  artists = Artist.query.all()
-
-  for artist in artists:
-    data.append(artist)
-
-  #data = Artist.query.all()
+  data = artists_query(request.args.get('genre')).all()
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, genres=Genre.query.order_by(Genre.name).all())
 
 @app.route('/artists/search', methods=['POST'])
+@replica_reads
 def search_artists():
-  search_term = request.form.get('search_term')
-  artists = db.session.query(Artist).filter(Artist.name.contains(search_term)).all()
-  data = []
-  for artist in artists:
-        # # Filter upcoming shows
-        # upcoming_shows = Show.query.filter_by(venue_id=venue.id).filter(
-        #     Show.start_time > datetime.utcnow().isoformat()).all()
-    res_result = {
-      "id": artist.id,
-      "name": artist.name,
-      #"num_upcoming_shows": upcoming_shows,
-    }
-    data.append(res_result)
-  response = {
-    "count": len(artists),
-    "data": data
-  } 
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  search_term = request.form.get('search_term', '')
+  response = search(Artist, search_term, request.form.get('page', 1, type=int))
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   # response={
@@ -410,6 +935,8 @@ def search_artists():
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@replica_reads
+@cached_page('artist', 'artist_id')
 def show_artist(artist_id):
   # # shows the venue page with the given venue_id
   # # TODO: replace with real venue data from the venues table, using venue_id
@@ -485,9 +1012,19 @@ def show_artist(artist_id):
   #   "upcoming_shows_count": 3,
   # }
   # data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  data = Artist.query.get(artist_id)
+  data = get_artist_detail(artist_id)
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  if not delete_entities(Artist, [artist_id]):
+    abort(404)
+  return jsonify({'success': True, 'deleted': artist_id})
+
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+  return jsonify({'success': True, 'deleted': delete_entities(Artist, requested_ids())})
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
@@ -512,7 +1049,7 @@ def edit_artist(artist_id):
   form.city.data=artist.city
   form.state.data=artist.state
   form.phone.data=artist.phone
-  form.genres.data=artist.genres
+  form.genres.data=[genre.name for genre in artist.genres]
   form.facebook_link.data=artist.facebook_link
 
   # TODO: populate form with fields from artist with ID <artist_id>
@@ -554,7 +1091,7 @@ def edit_artist_submission(artist_id):
       artist.city = request.form["city"]
       artist.state = request.form["state"]
       artist.phone = request.form["phone"]
-      artist.genres = request.form.getlist("genres")
+      artist.genres = get_or_create_genres(request.form.getlist("genres"))
       artist.facebook_link = request.form["facebook_link"]
       db.session.commit()
       flash('Artist ' + request.form['name'] + ' was successfully updated.')
@@ -592,7 +1129,7 @@ def edit_venue(venue_id):
   form.state.data=venue.state
   form.address.data=venue.address
   form.phone.data=venue.phone
-  form.genres.data=venue.genres
+  form.genres.data=[genre.name for genre in venue.genres]
   form.facebook_link.data=venue.facebook_link
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
@@ -631,7 +1168,7 @@ def edit_venue_submission(venue_id):
       venue.city = request.form["city"]
       venue.state = request.form["state"]
       venue.phone = request.form["phone"]
-      venue.genres = request.form.getlist("genres")
+      venue.genres = get_or_create_genres(request.form.getlist("genres"))
       venue.facebook_link = request.form["facebook_link"]
       db.session.commit()
       flash('Venue ' + request.form['name'] + ' was successfully updated.')
@@ -658,18 +1195,15 @@ def create_artist_submission():
   # TODO: modify data to be the data object returned from db insertion
 
   # error=False
-  genres=[]
-  genres.append(request.form.getlist("genres"))
   new_artist = {
     "name": request.form.get("name"),
     "city": request.form.get("city"), 
     "state": request.form.get("state"), 
     "phone": request.form.get("phone"),
-    "genres": genres,
     "facebook_link": request.form.get("facebook_link")
   }
   try:
-    artist=Artist(name=new_artist["name"], city=new_artist["city"], state=new_artist["state"], phone=new_artist["phone"], genres=new_artist["genres"], facebook_link=new_artist["facebook_link"])
+    artist=Artist(name=new_artist["name"], city=new_artist["city"], state=new_artist["state"], phone=new_artist["phone"], genres=get_or_create_genres(request.form.getlist("genres")), facebook_link=new_artist["facebook_link"])
     db.session.add(artist)
     db.session.commit()
     flash('Artist ' + request.form['name'] + ' was successfully listed.')
@@ -694,10 +1228,10 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@replica_reads
+@cached_page('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
+  # displays list of shows at /shows, upcoming only unless ?include_past=1
   # data=[{
   #   "venue_id": 1,
   #   "venue_name": "The Musical Hop",
@@ -735,20 +1269,20 @@ def shows():
   #   "start_time": "2035-04-15T20:00:00.000Z"
   # }]
 
-  data = []
-  shows = Show.query.all()#order_by(Show.start_time).filter(Show.start_time >= datetime.now())
-
-  for show in shows:
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
+  include_past = request.args.get('include_past', 0, type=int) == 1
+  rows, next_cursor = get_shows_page(parse_show_cursor(request.args.get('after')), include_past)
+
+  data = ({
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": row.start_time.strftime("%Y-%m-%d %H:%M:%S")
+  } for row in rows)
 
-  return render_template('pages/shows.html', shows=data)
+  return Response(stream_with_context(stream_template(
+    'pages/shows.html', shows=data, next_cursor=next_cursor, include_past=include_past)))
   
   # shows=Show.query.all()
   # """Loop through all shows and populate data."""
@@ -780,12 +1314,29 @@ def create_show_submission():
   # error=False
   artist_id=request.form['artist_id']
   venue_id=request.form['venue_id']
-  start_time=request.form['start_time']
   try:
-    new_show=Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(new_show)
-    db.session.commit()
-    flash('Show was successfully listed!')
+    start_time=dateutil.parser.parse(request.form['start_time'])
+  except (ValueError, OverflowError):
+    flash('An error occurred. Show could not be listed.')
+    return render_template('pages/home.html')
+  end_time=show_end_time(start_time)
+  try:
+    venue_booked, artist_booked = booking_conflicts(venue_id, artist_id, start_time, end_time)
+    if venue_booked or artist_booked:
+      flash('Show could not be listed: the {} already booked at that time.'.format(
+        'venue and artist are' if venue_booked and artist_booked else 'venue is' if venue_booked else 'artist is'))
+    else:
+      new_show=Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
+      db.session.add(new_show)
+      db.session.commit()
+      flash('Show was successfully listed!')
+  except IntegrityError as e:
+    db.session.rollback()
+    if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+      # a concurrent booking won the race to the exclusion constraint
+      flash('Show could not be listed: the venue or artist is already booked at that time.')
+    else:
+      flash('An error occurred. Show could not be listed.')
   except:
     # error=True
     db.session.rollback()
@@ -802,12 +1353,174 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   # return render_template('pages/home.html')
 
+def requested_slots():
+  # {"slots": [{"venue_id": 1, "artist_id": 4, "start_time": "2035-04-01T20:00:00"}, ...]}
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict):
+    abort(400)
+  slots = body.get('slots')
+  if not isinstance(slots, list) or not 0 < len(slots) <= app.config['MAX_AVAILABILITY_SLOTS']:
+    abort(400)
+  parsed = []
+  for slot in slots:
+    try:
+      venue_id, artist_id = slot['venue_id'], slot['artist_id']
+      start_time = dateutil.parser.parse(slot['start_time'])
+    except (TypeError, KeyError, ValueError, OverflowError):
+      abort(400)
+    # exact type check: true and false are ints to isinstance
+    if type(venue_id) is not int or type(artist_id) is not int:
+      abort(400)
+    parsed.append({'venue_id': venue_id, 'artist_id': artist_id,
+                   'start_time': start_time, 'end_time': show_end_time(start_time)})
+  return parsed
+
+@app.route('/shows/availability', methods=['POST'])
+def shows_availability():
+  # lets scheduling tools check a batch of candidate slots before booking
+  slots = check_availability(requested_slots())
+  for slot in slots:
+    slot['start_time'] = slot['start_time'].isoformat()
+    slot['end_time'] = slot['end_time'].isoformat()
+  return jsonify({'success': True, 'slots': slots})
+
+#  API
+#  ----------------------------------------------------------------
+#  JSON versions of the listing and detail pages. Each response carries an
+#  ETag and Last-Modified built from a cheap version query (max updated_at,
+#  row counts, upcoming show counts), so a client revalidating unchanged
+#  data gets a 304 without the payload being built.
+
+def json_default(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(repr(value))
+
+def table_version(model):
+  return [
+    db.session.query(db.func.max(model.updated_at)).as_scalar(),
+    db.session.query(db.func.count(model.id)).as_scalar()
+  ]
+
+def upcoming_version():
+  # changes whenever a show moves from upcoming to past
+  return [db.session.query(db.func.count(Show.id)).filter(Show.start_time > db.func.now()).as_scalar()]
+
+def entity_version(model, entity_id, fk, counterpart):
+  entity = db.session.query(model.updated_at).filter(model.id == entity_id).as_scalar()
+  shows = db.session.query(
+      db.func.max(Show.updated_at),
+      db.func.max(counterpart.updated_at),
+      db.func.count(Show.id),
+      db.func.count(Show.id).filter(Show.start_time > db.func.now())
+    ).join(counterpart, getattr(Show, counterpart.__tablename__.lower() + '_id') == counterpart.id
+    ).filter(fk == entity_id).subquery()
+  return db.session.query(entity, shows).one()
+
+def conditional_json(version, build):
+  # version: values fetched in one query that change whenever the payload does.
+  # there is no Last-Modified: the newest updated_at stays the same when a
+  # row is deleted or a show becomes past, which the counts in the ETag catch.
+  etag = hashlib.md5((request.full_path + repr(tuple(version))).encode()).hexdigest()
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = Response(json.dumps(build(), separators=(',', ':'), default=json_default),
+                        mimetype='application/json')
+  response.set_etag(etag)
+  response.cache_control.no_cache = True
+  return response
+
+@app.route('/api/venues')
+@replica_reads
+def api_venues():
+  args = request.args
+  version = db.session.query(*(table_version(Venue) + table_version(Show) + upcoming_version())).one()
+  return conditional_json(version, lambda: {
+    'areas': get_venue_areas(args.get('genre'), args.get('city'), args.get('state'))
+  })
+
+@app.route('/api/venues/<int:venue_id>')
+@replica_reads
+def api_venue(venue_id):
+  version = entity_version(Venue, venue_id, Show.venue_id, Artist)
+  if version[0] is None:
+    abort(404)
+  return conditional_json(version, lambda: {'venue': get_venue_detail(venue_id)})
+
+@app.route('/api/artists')
+@replica_reads
+def api_artists():
+  version = db.session.query(*table_version(Artist)).one()
+  return conditional_json(version, lambda: {
+    'artists': [row._asdict() for row in artists_query(request.args.get('genre'))]
+  })
+
+@app.route('/api/artists/<int:artist_id>')
+@replica_reads
+def api_artist(artist_id):
+  version = entity_version(Artist, artist_id, Show.artist_id, Venue)
+  if version[0] is None:
+    abort(404)
+  return conditional_json(version, lambda: {'artist': get_artist_detail(artist_id)})
+
+@app.route('/api/shows')
+@replica_reads
+def api_shows():
+  version = db.session.query(*(
+    table_version(Show) + table_version(Venue) + table_version(Artist) + upcoming_version())).one()
+  def build():
+    include_past = request.args.get('include_past', 0, type=int) == 1
+    rows, next_cursor = get_shows_page(parse_show_cursor(request.args.get('after')), include_past)
+    return {'shows': [row._asdict() for row in rows], 'next': next_cursor}
+  return conditional_json(version, build)
+
+#  Assets
+#  ----------------------------------------------------------------
+
+asset_manifest = load_manifest(app.static_folder)
+
+@app.context_processor
+def inject_asset_tags():
+  return {'asset_tags': lambda name: asset_tags(name, asset_manifest, url_for)}
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+  return send_asset(app.static_folder, filename, request.accept_encodings)
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def metrics():
+  # the primary's pool and every replica's, which serve most of the reads
+  pools = {'primary': db.engine.pool}
+  for bind in app.config['SQLALCHEMY_BINDS']:
+    pools[bind] = db.get_engine(app, bind=bind).pool
+  return Response(render_metrics(request_metrics.metrics() + pool_metrics(pools)),
+                  mimetype='text/plain; version=0.0.4')
+
+def api_error(error):
+    # the /api/ endpoints answer with JSON, not an HTML page
+    return jsonify({'success': False, 'error': error.code, 'message': error.name.lower()}), error.code
+
+@app.errorhandler(HTTPException)
+def http_error(error):
+    # the errors without a page of their own, e.g. a bad cursor's 400
+    if request.path.startswith('/api/'):
+        return api_error(error)
+    return error
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return api_error(error)
     return render_template('errors/404.html'), 404
 
 @app.errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return api_error(error)
     return render_template('errors/500.html'), 500
 
 
@@ -821,6 +1534,183 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+IMPORTS = {
+  'venues': (Venue, VenueForm),
+  'artists': (Artist, ArtistForm),
+  'shows': (Show, ShowForm),
+}
+
+def read_records(path):
+  # CSV (genres separated by ';') or JSON lines, one record at a time
+  with open(path, newline='') as f:
+    if path.endswith('.csv'):
+      for record in csv.DictReader(f):
+        if record.get('genres'):
+          record['genres'] = [genre.strip() for genre in record['genres'].split(';')]
+        yield record
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+def validate_record(model, form_class, record):
+  # runs the record through the same form the create page uses and returns
+  # (row, None) ready for insertion, or (None, errors)
+  if model is Show and not str(record.get('start_time') or '').strip():
+    # ShowForm would fill in its default, the time the process started
+    return None, {'start_time': ['This field is required.']}
+  formdata = MultiDict()
+  for key, value in record.items():
+    for item in (value if isinstance(value, list) else [value]):
+      formdata.add(key, '' if item is None else str(item))
+  form = form_class(formdata=formdata, meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+  row = {key: value for key, value in form.data.items() if key in model.__table__.columns or key == 'genres'}
+  if model is Show:
+    try:
+      row['artist_id'] = int(row['artist_id'])
+      row['venue_id'] = int(row['venue_id'])
+    except (TypeError, ValueError):
+      return None, {'artist_id/venue_id': ['Not a valid id.']}
+    # COPY skips column defaults
+    row['end_time'] = show_end_time(row['start_time'])
+  return row, None
+
+def allocate_ids(model, count):
+  # primary keys for a chunk, taken up front so the genre links can be
+  # written alongside the rows without reading the ids back
+  if db.engine.dialect.name == 'postgresql':
+    sequence = '"{}_id_seq"'.format(model.__tablename__)
+    return [row[0] for row in db.session.execute(
+      db.text("SELECT nextval('{}') FROM generate_series(1, :count)".format(sequence)), {'count': count})]
+  # other databases: the import is assumed to be the only writer
+  start = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+  return list(range(start, start + count))
+
+def insert_rows(table, rows, method):
+  if method == 'copy':
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+      writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+      table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+  else:
+    db.session.execute(table.insert(), rows)
+
+def insert_chunk(model, rows, method):
+  if model is Show:
+    insert_rows(Show.__table__, rows, method)
+    return
+  names = [row.pop('genres') or [] for row in rows]
+  for row, row_id in zip(rows, allocate_ids(model, len(rows))):
+    row['id'] = row_id
+  insert_rows(model.__table__, rows, method)
+  genre_ids = dict((genre.name, genre.id) for genre in get_or_create_genres(chain.from_iterable(names)))
+  links, fk = (venue_genres, 'venue_id') if model is Venue else (artist_genres, 'artist_id')
+  link_rows = [{'genre_id': genre_ids[name], fk: row['id']}
+               for row, row_names in zip(rows, names) for name in set(row_names)]
+  if link_rows:
+    insert_rows(links, link_rows, method)
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+@click.option('--method', type=click.Choice(['copy', 'executemany']),
+              help='Insert strategy, defaults to COPY on PostgreSQL.')
+def import_data(kind, path, chunk_size, method):
+  """Bulk load venues, artists or shows from a .csv or JSON-lines file."""
+  model, form_class = IMPORTS[kind]
+  if method is None:
+    method = 'copy' if db.engine.dialect.name == 'postgresql' else 'executemany'
+  records = enumerate(read_records(path), 1)
+  inserted = rejected = 0
+  started = time.time()
+  with app.test_request_context():
+    while True:
+      batch = list(islice(records, chunk_size))
+      if not batch:
+        break
+      rows = []
+      for number, record in batch:
+        row, errors = validate_record(model, form_class, record)
+        if errors:
+          rejected += 1
+          click.echo('record {}: {}'.format(number, errors), err=True)
+        else:
+          rows.append(row)
+      if rows:
+        try:
+          insert_chunk(model, rows, method)
+          db.session.commit()
+          inserted += len(rows)
+        except Exception as e:
+          db.session.rollback()
+          rejected += len(rows)
+          click.echo('chunk ending at record {} failed: {}'.format(batch[-1][0], e), err=True)
+      click.echo('{} inserted, {} rejected, {:.0f} records/s'.format(
+        inserted, rejected, (inserted + rejected) / (time.time() - started)))
+  # core inserts bypass the ORM events, so drop the derived pages here.
+  # this process has its own page cache: only the redis backend, shared
+  # with the web workers, gets cleared for them; lru workers serve their
+  # copies until CACHE_TIMEOUT.
+  page_cache.clear()
+  elapsed = time.time() - started
+  click.echo('done: {} {} inserted, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+    inserted, kind, rejected, elapsed, inserted / elapsed if elapsed else inserted))
+
+@app.cli.command('build-assets')
+def build_assets_command():
+  """Bundle, minify, fingerprint and precompress the CSS and JS."""
+  manifest = build_assets(app.static_folder, app.static_url_path)
+  for name, filename in sorted(manifest['bundles'].items()):
+    click.echo('{:<10} -> {}/{}'.format(name, 'static/dist', filename))
+  click.echo('restart the app to serve the new bundles')
+
+# the queries behind each view, with sample arguments
+ADVISOR_QUERIES = [
+  ('venues', lambda: venue_areas_query()),
+  ('show_venue', lambda: entity_shows_query(Show.venue_id == 1, Artist)),
+  ('show_artist', lambda: entity_shows_query(Show.artist_id == 1, Venue)),
+  ('shows', lambda: shows_query().limit(app.config['SHOWS_PER_PAGE'] + 1)),
+  ('shows?include_past=1', lambda: shows_query(include_past=True).limit(app.config['SHOWS_PER_PAGE'] + 1)),
+  ('search_venues', lambda: search_query(Venue, 'music').limit(app.config['SEARCH_RESULTS_PER_PAGE'])),
+  ('search_artists', lambda: search_query(Artist, 'band').limit(app.config['SEARCH_RESULTS_PER_PAGE'])),
+]
+
+SEQ_SCAN = re.compile(r'Seq Scan on "?(\w+)"?.*rows=(\d+)')
+
+@app.cli.command('advise-indexes')
+@click.option('--analyze', is_flag=True, help='Run EXPLAIN ANALYZE (executes the queries).')
+@click.option('--min-rows', default=1000, show_default=True,
+              help='Ignore sequential scans of tables estimated smaller than this.')
+def advise_indexes(analyze, min_rows):
+  """EXPLAIN the queries behind each view and flag sequential scans."""
+  flagged = 0
+  for view, build_query in ADVISOR_QUERIES:
+    statement = build_query().statement.compile(
+      dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    explain = 'EXPLAIN ANALYZE ' if analyze else 'EXPLAIN '
+    plan = [row[0] for row in db.session.execute(db.text(explain + str(statement)))]
+    scans = [m for m in (SEQ_SCAN.search(line) for line in plan) if m and int(m.group(2)) >= min_rows]
+    click.echo('{:<24} {}'.format(view, 'SEQ SCAN' if scans else 'ok'))
+    for match in scans:
+      flagged += 1
+      click.echo('    sequential scan on {} (~{} rows)'.format(match.group(1), match.group(2)))
+    if scans:
+      click.echo('\n'.join('      ' + line for line in plan))
+  if flagged:
+    sys.exit(1)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import abort, send_from_directory
+from markupsafe import Markup, escape
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask build-assets` concatenates and minifies the files of each bundle,
+# names the result after its content hash and writes .gz (and .br, with the
+# brotli package) variants next to it, plus a manifest mapping bundle names
+# to the built files. Templates call asset_tags(); without a manifest they
+# fall back to the individual source files. The files of the last few
+# builds stay on disk and listed in the manifest, so pages rendered before
+# a rebuild (cached pages, old workers, open browser tabs) keep working.
+#----------------------------------------------------------------------------#
+
+# bundle name -> source files, relative to the static folder
+BUNDLES = {
+  'main.css': [
+    'css/bootstrap.min.css',
+    'css/layout.main.css',
+    'css/main.css',
+    'css/main.responsive.css',
+    'css/main.quickfix.css',
+  ],
+  'head.js': [
+    'js/libs/modernizr-2.8.2.min.js',
+    'js/libs/moment.min.js',
+    'js/script.js',
+  ],
+  'main.js': [
+    'js/libs/jquery-1.11.1.min.js',
+    'js/libs/bootstrap-3.1.1.min.js',
+    'js/plugins.js',
+  ],
+}
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# earlier builds of each bundle kept and served next to the current one
+BUILDS_KEPT = 5
+
+# built files never change under the same name, so browsers may keep them
+FAR_FUTURE = 'public, max-age=31536000, immutable'
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)(?!data:|https?:|//|/)([^'")]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'^//[#@] sourceMappingURL=.*$', re.M)
+BUILT_FILE = re.compile(r'^(.+)\.[0-9a-f]{12}(\.\w+)$')
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+def minify_css(text, source, static_url_path):
+  # drops comments and indentation, and makes url()s absolute since the
+  # bundle is served from a different directory than its sources
+  def absolute(match):
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(source), match.group(2)))
+    return 'url({}/{})'.format(static_url_path, path)
+
+  text = CSS_URL.sub(absolute, CSS_COMMENT.sub('', text))
+  return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def minify_js(text):
+  # the libraries ship minified; our own scripts go through rjsmin if it is
+  # installed and are otherwise only stripped of source map comments
+  text = SOURCE_MAP.sub('', text)
+  try:
+    import rjsmin
+  except ImportError:
+    return text.strip()
+  return rjsmin.jsmin(text)
+
+
+def build_bundle(static_folder, static_url_path, name, sources):
+  # returns the name of the built file inside the dist directory
+  parts = []
+  for source in sources:
+    with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+      text = f.read()
+    parts.append(minify_css(text, source, static_url_path) if name.endswith('.css') else minify_js(text))
+  # the semicolon keeps a script without a trailing one from running into the next
+  data = (';\n' if name.endswith('.js') else '\n').join(parts).encode('utf-8')
+  stem, ext = os.path.splitext(name)
+  filename = '{}.{}{}'.format(stem, hashlib.sha256(data).hexdigest()[:12], ext)
+  path = os.path.join(static_folder, DIST_DIR, filename)
+  with open(path, 'wb') as f:
+    f.write(data)
+  with open(path + '.gz', 'wb') as f:
+    # mtime=0 keeps rebuilds byte-identical
+    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+  try:
+    import brotli
+  except ImportError:
+    pass
+  else:
+    with open(path + '.br', 'wb') as f:
+      f.write(brotli.compress(data, quality=11))
+  return filename
+
+
+def prune_builds(directory, current, keep=BUILDS_KEPT):
+  # removes all but the current and the `keep` newest earlier files of each
+  # bundle, with their compressed variants; returns the names left
+  builds = {}
+  for filename in os.listdir(directory):
+    match = BUILT_FILE.match(filename)
+    if match:
+      builds.setdefault(match.group(1) + match.group(2), []).append(filename)
+  kept = set()
+  for name, filenames in builds.items():
+    filenames.sort(key=lambda filename: (
+      filename != current.get(name), -os.path.getmtime(os.path.join(directory, filename))))
+    kept.update(filenames[:keep + 1])
+    for filename in filenames[keep + 1:]:
+      for suffix in ('',) + COMPRESSED_SUFFIXES:
+        path = os.path.join(directory, filename + suffix)
+        if os.path.exists(path):
+          os.remove(path)
+  return kept
+
+
+def build_assets(static_folder, static_url_path, bundles=BUNDLES, keep=BUILDS_KEPT):
+  # builds every bundle, prunes old builds and writes the manifest: the
+  # current file of each bundle and every built file that may be served
+  directory = os.path.join(static_folder, DIST_DIR)
+  os.makedirs(directory, exist_ok=True)
+  current = {name: build_bundle(static_folder, static_url_path, name, sources)
+             for name, sources in bundles.items()}
+  manifest = {'bundles': current, 'files': sorted(prune_builds(directory, current, keep))}
+  # replaced in one step, since running workers re-read it
+  path = os.path.join(directory, MANIFEST)
+  with open(path + '.tmp', 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.replace(path + '.tmp', path)
+  return manifest
+
+
+def load_manifest(static_folder):
+  try:
+    with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {'bundles': {}, 'files': []}
+
+
+_manifests = {}
+
+def current_manifest(static_folder):
+  # the manifest on disk, re-read whenever a build replaces it, so every
+  # worker serves the files of builds newer than the one it started with
+  path = os.path.join(static_folder, DIST_DIR, MANIFEST)
+  try:
+    mtime = os.stat(path).st_mtime_ns
+  except OSError:
+    return load_manifest(static_folder)
+  cached = _manifests.get(path)
+  if cached is None or cached[0] != mtime:
+    cached = _manifests[path] = (mtime, load_manifest(static_folder))
+  return cached[1]
+
+
+def asset_tags(name, manifest, url_for, bundles=BUNDLES):
+  # <link>/<script> tags for a bundle: the built file when there is one,
+  # otherwise one tag per source
+  if name in manifest['bundles']:
+    urls = [url_for('asset', filename=manifest['bundles'][name])]
+  else:
+    urls = [url_for('static', filename=source) for source in bundles[name]]
+  if name.endswith('.css'):
+    tag = '<link type="text/css" rel="stylesheet" href="{}" />'
+  else:
+    tag = '<script type="text/javascript" src="{}"></script>'
+  return Markup('\n'.join(tag.format(escape(url)) for url in urls))
+
+
+def send_asset(static_folder, filename, accept_encodings):
+  # serves a built file listed in the manifest, precompressed when the
+  # client accepts it. anything else in the directory, the manifest
+  # included, must not get the immutable caching.
+  if filename not in current_manifest(static_folder)['files']:
+    abort(404)
+  directory = os.path.join(static_folder, DIST_DIR)
+  mimetype = mimetypes.guess_type(filename)[0]
+  for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+    if accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+      response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+      response.headers['Content-Encoding'] = encoding
+      break
+  else:
+    response = send_from_directory(directory, filename, mimetype=mimetype)
+  response.headers['Cache-Control'] = FAR_FUTURE
+  response.headers.pop('Expires', None)
+  response.vary.add('Accept-Encoding')
+  return response
@@ -0,0 +1,57 @@
+"""Micro-benchmark for the `datetime` template filter.
+
+Compares the per-call cost of the original filter (parse the value with
+dateutil and let babel resolve the pattern on every call) with the cached
+format_datetime in app.py, on a show-heavy page worth of dates.
+
+    $ python bench_filters.py
+"""
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime, render_datetime
+
+CALLS = 20000
+SHOWS = 500
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def per_call_us(fn, values):
+  count = len(values)
+  runs = max(1, CALLS // count)
+  seconds = timeit.timeit(lambda: [fn(value, 'full') for value in values], number=runs)
+  return seconds / (runs * count) * 1e6
+
+
+if __name__ == '__main__':
+  start = datetime(2035, 4, 1, 20, 0)
+  dates = [start + timedelta(days=i) for i in range(SHOWS)]
+  strings = [date.isoformat() for date in dates]
+
+  for value in (dates[0], strings[0]):
+    assert format_datetime(value, 'full') == legacy_format_datetime(strings[0], 'full')
+
+  results = [
+    ('legacy, string input', per_call_us(legacy_format_datetime, strings)),
+    ('cached, string input', per_call_us(format_datetime, strings)),
+  ]
+  # first render of every date: pattern compiled once, nothing memoized yet
+  render_datetime.cache_clear()
+  seconds = timeit.timeit(lambda: [format_datetime(date, 'full') for date in dates], number=1)
+  results.append(('cached, datetime input (cold)', seconds / SHOWS * 1e6))
+  results.append(('cached, datetime input (warm)', per_call_us(format_datetime, dates)))
+
+  baseline = results[0][1]
+  for name, cost in results:
+    print('{:<32} {:>9.2f} us/call  {:>6.1f}x'.format(name, cost, baseline / cost))
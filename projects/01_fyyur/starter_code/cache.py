@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Page cache backends.
+#
+# Both backends store rendered pages (bytes) under string keys and support
+# dropping every key that starts with a prefix, which is how model changes
+# invalidate the pages derived from them.
+#
+# Each drop also bumps a generation counter for its prefix. A page rendered
+# from rows read before a drop passes the generation it saw when it started
+# to set(), which then discards it instead of caching the old rows.
+# Generations are kept for the prefixes key_prefixes() returns, the ones the
+# app drops; a drop with any other prefix still deletes, but is not seen by
+# renders already in progress.
+#----------------------------------------------------------------------------#
+
+def key_prefixes(key):
+  # '' and every prefix of the key ending in ':', e.g. '', 'venue:' and
+  # 'venue:3:' for 'venue:3:'
+  parts = key.split(':')
+  return [''] + [':'.join(parts[:i]) + ':' for i in range(1, len(parts))]
+
+
+class LRUCache(object):
+  # in-process cache, bounded by entry count, entries expire after `timeout` seconds
+
+  def __init__(self, max_entries=1024, timeout=300):
+    self.max_entries = max_entries
+    self.timeout = timeout
+    self._entries = OrderedDict()
+    self._generations = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires, value = entry
+      if expires < time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def _generation(self, key):
+    return tuple(self._generations.get(prefix, 0) for prefix in key_prefixes(key))
+
+  def generation(self, key):
+    with self._lock:
+      return self._generation(key)
+
+  def set(self, key, value, generation=None):
+    with self._lock:
+      if generation is not None and generation != self._generation(key):
+        return
+      self._entries[key] = (time.time() + self.timeout, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete_prefix(self, prefix):
+    with self._lock:
+      self._generations[prefix] = self._generations.get(prefix, 0) + 1
+      for key in [key for key in self._entries if key.startswith(prefix)]:
+        del self._entries[key]
+
+  def clear(self):
+    with self._lock:
+      self._generations[''] = self._generations.get('', 0) + 1
+      self._entries.clear()
+
+
+class RedisCache(object):
+  # cache shared between workers, on any server speaking the Redis protocol
+
+  def __init__(self, client, timeout=300, namespace='fyyur:page:',
+               generation_namespace='fyyur:page-generation:'):
+    self.client = client
+    self.timeout = timeout
+    self.namespace = namespace
+    # outside `namespace`, so clear() does not reset the counters
+    self.generation_namespace = generation_namespace
+
+  def _generation_keys(self, key):
+    return [self.generation_namespace + prefix for prefix in key_prefixes(key)]
+
+  def generation(self, key):
+    return tuple(int(count or 0) for count in self.client.mget(self._generation_keys(key)))
+
+  def get(self, key):
+    return self.client.get(self.namespace + key)
+
+  def set(self, key, value, generation=None):
+    if generation is None:
+      self.client.setex(self.namespace + key, self.timeout, value)
+      return
+    from redis.exceptions import WatchError
+    keys = self._generation_keys(key)
+    # WATCH makes the write fail if another worker bumps a generation
+    # between the check and the SETEX
+    with self.client.pipeline() as pipe:
+      try:
+        pipe.watch(*keys)
+        if tuple(int(count or 0) for count in pipe.mget(keys)) != generation:
+          return
+        pipe.multi()
+        pipe.setex(self.namespace + key, self.timeout, value)
+        pipe.execute()
+      except WatchError:
+        pass
+
+  def delete_prefix(self, prefix):
+    self.client.incr(self.generation_namespace + prefix)
+    keys = list(self.client.scan_iter(match=self.namespace + prefix + '*', count=500))
+    if keys:
+      self.client.delete(*keys)
+
+  def clear(self):
+    self.delete_prefix('')
+
+
+def make_cache(config):
+  # CACHE_TYPE 'redis' needs the redis package and CACHE_REDIS_URL
+  if config['CACHE_TYPE'] == 'redis':
+    import redis
+    client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+    return RedisCache(client, timeout=config['CACHE_TIMEOUT'])
+  return LRUCache(max_entries=config['CACHE_MAX_ENTRIES'], timeout=config['CACHE_TIMEOUT'])
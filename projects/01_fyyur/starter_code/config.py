@@ -1,5 +1,8 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie, which also carries the read-your-writes window.
+# Every worker must share it; the random fallback only suits a single
+# development process.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,3 +14,50 @@ DEBUG = True
 
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+
+# Number of hits per page on the venue and artist search pages
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Number of shows per page on /shows
+SHOWS_PER_PAGE = 30
+
+# Number of rendered dates kept by the `datetime` template filter
+DATETIME_FILTER_CACHE_SIZE = 4096
+
+# Page cache: 'lru' keeps pages in process, 'redis' shares them through any
+# Redis-compatible server at CACHE_REDIS_URL
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+
+# Length of a booking; shows at one venue or by one artist may not overlap
+SHOW_DURATION_MINUTES = int(os.environ.get('SHOW_DURATION_MINUTES', 120))
+
+# Most slots accepted by one POST /shows/availability request
+MAX_AVAILABILITY_SLOTS = 1000
+
+# PostgreSQL connection pool, per worker process. Checkouts wait up to
+# DB_POOL_TIMEOUT seconds once DB_POOL_SIZE + DB_MAX_OVERFLOW connections are
+# in use; DB_STATEMENT_TIMEOUT is in milliseconds, 0 disables it.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
+# Read replicas for the read-only pages, comma separated. Without any every
+# query goes to SQLALCHEMY_DATABASE_URI.
+SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+
+# Seconds a browser keeps reading from the primary after its own write, to
+# cover replication lag
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+
+# Requests running more SQL statements than this are logged as warnings and
+# counted on /metrics, the usual sign of an N+1 query pattern
+SQL_QUERY_WARN_THRESHOLD = int(os.environ.get('SQL_QUERY_WARN_THRESHOLD', 20))
+
+# One JSON line per request goes here; stderr when unset
+REQUEST_LOG_FILE = os.environ.get('REQUEST_LOG_FILE')
@@ -0,0 +1,166 @@
+import threading
+import time
+from bisect import bisect_left
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#
+# Counters kept in process and rendered in the Prometheus text format by the
+# /metrics view. Each worker process reports its own numbers.
+#----------------------------------------------------------------------------#
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# upper bounds of the SQL statements per request histogram buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram(object):
+  # cumulative-bucket histogram of observed values
+
+  def __init__(self, buckets=LATENCY_BUCKETS):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def samples(self, name, labels=''):
+    cumulative = 0
+    for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+      cumulative += count
+      yield '{}_bucket{{{}le="{}"}}'.format(name, labels + ',' if labels else '', bound), cumulative
+    yield '{}_sum{}'.format(name, '{' + labels + '}' if labels else ''), self.sum
+    yield '{}_count{}'.format(name, '{' + labels + '}' if labels else ''), self.count
+
+
+class InstrumentedQueuePool(QueuePool):
+  # QueuePool that times every checkout and counts the ones that had to wait
+  # for a connection because the pool and its overflow were all in use
+
+  def __init__(self, *args, **kwargs):
+    super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+    self._metrics_lock = threading.Lock()
+    self.checkout_seconds = Histogram()
+    self.waits = 0
+    self.timeouts = 0
+
+  def _do_get(self):
+    exhausted = (self._max_overflow > -1 and self.checkedin() == 0
+                 and self.overflow() >= self._max_overflow)
+    start = time.perf_counter()
+    try:
+      return super(InstrumentedQueuePool, self)._do_get()
+    except Exception:
+      with self._metrics_lock:
+        self.timeouts += 1
+      raise
+    finally:
+      elapsed = time.perf_counter() - start
+      with self._metrics_lock:
+        self.checkout_seconds.observe(elapsed)
+        self.waits += exhausted
+
+  def recreate(self):
+    # keeps the counters when the engine is disposed and the pool rebuilt
+    pool = super(InstrumentedQueuePool, self).recreate()
+    pool.checkout_seconds, pool.waits, pool.timeouts = self.checkout_seconds, self.waits, self.timeouts
+    return pool
+
+
+class RequestMetrics(object):
+  # per-endpoint request timings and SQL statement counts
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.requests = {}
+    self.durations = {}
+    self.render_seconds = {}
+    self.sql_seconds = {}
+    self.queries = {}
+    self.flagged = {}
+
+  def observe(self, endpoint, status, duration, render_time, query_count, sql_time, flagged):
+    with self._lock:
+      self.requests[endpoint, status] = self.requests.get((endpoint, status), 0) + 1
+      for histograms, value in ((self.durations, duration), (self.render_seconds, render_time),
+                                (self.sql_seconds, sql_time)):
+        histograms.setdefault(endpoint, Histogram()).observe(value)
+      self.queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(query_count)
+      if flagged:
+        self.flagged[endpoint] = self.flagged.get(endpoint, 0) + 1
+
+  def metrics(self):
+    def histogram_samples(name, histograms):
+      return [sample for endpoint, histogram in sorted(histograms.items())
+              for sample in histogram.samples(name, 'endpoint="{}"'.format(endpoint))]
+
+    with self._lock:
+      return [
+        ('fyyur_http_requests_total', 'counter', 'Requests served, by endpoint and status.',
+         [('fyyur_http_requests_total{{endpoint="{}",status="{}"}}'.format(endpoint, status), count)
+          for (endpoint, status), count in sorted(self.requests.items())]),
+        ('fyyur_http_request_duration_seconds', 'histogram', 'Wall time per request.',
+         histogram_samples('fyyur_http_request_duration_seconds', self.durations)),
+        ('fyyur_template_render_seconds', 'histogram', 'Template rendering time per request.',
+         histogram_samples('fyyur_template_render_seconds', self.render_seconds)),
+        ('fyyur_sql_seconds', 'histogram', 'Time spent in SQL statements per request.',
+         histogram_samples('fyyur_sql_seconds', self.sql_seconds)),
+        ('fyyur_sql_queries_per_request', 'histogram', 'SQL statements executed per request.',
+         histogram_samples('fyyur_sql_queries_per_request', self.queries)),
+        ('fyyur_sql_query_threshold_exceeded_total', 'counter',
+         'Requests that ran more SQL statements than SQL_QUERY_WARN_THRESHOLD, a sign of N+1 queries.',
+         [('fyyur_sql_query_threshold_exceeded_total{{endpoint="{}"}}'.format(endpoint), count)
+          for endpoint, count in sorted(self.flagged.items())]),
+      ]
+
+
+def pool_metrics(pools):
+  # (name, type, help, samples) for the connection pools, given as
+  # {bind label: pool}; every sample carries a bind="..." label
+  queue_pools = [(bind, pool) for bind, pool in sorted(pools.items()) if isinstance(pool, QueuePool)]
+  instrumented = []
+  for bind, pool in queue_pools:
+    if isinstance(pool, InstrumentedQueuePool):
+      labels = 'bind="{}"'.format(bind)
+      with pool._metrics_lock:
+        instrumented.append((labels, list(pool.checkout_seconds.samples('fyyur_db_pool_checkout_seconds', labels)),
+                             pool.waits, pool.timeouts))
+
+  def gauge(name, help, value):
+    return (name, 'gauge', help,
+            [('{}{{bind="{}"}}'.format(name, bind), value(pool)) for bind, pool in queue_pools])
+
+  metrics = []
+  if queue_pools:
+    metrics += [
+      gauge('fyyur_db_pool_size', 'Connections the pool keeps open.', lambda pool: pool.size()),
+      gauge('fyyur_db_pool_checked_in', 'Idle connections in the pool.', lambda pool: pool.checkedin()),
+      gauge('fyyur_db_pool_checked_out', 'Connections in use.', lambda pool: pool.checkedout()),
+      gauge('fyyur_db_pool_overflow', 'Connections open beyond the pool size.', lambda pool: pool.overflow()),
+    ]
+  if instrumented:
+    metrics += [
+      ('fyyur_db_pool_checkout_seconds', 'histogram', 'Time spent acquiring a connection.',
+       [sample for _, samples, _, _ in instrumented for sample in samples]),
+      ('fyyur_db_pool_waits_total', 'counter', 'Checkouts that found the pool exhausted.',
+       [('fyyur_db_pool_waits_total{{{}}}'.format(labels), waits) for labels, _, waits, _ in instrumented]),
+      ('fyyur_db_pool_timeouts_total', 'counter', 'Checkouts that failed, usually after pool_timeout.',
+       [('fyyur_db_pool_timeouts_total{{{}}}'.format(labels), timeouts) for labels, _, _, timeouts in instrumented]),
+    ]
+  return metrics
+
+
+def render_metrics(metrics):
+  lines = []
+  for name, kind, help, samples in metrics:
+    lines.append('# HELP {} {}'.format(name, help))
+    lines.append('# TYPE {} {}'.format(name, kind))
+    lines.extend('{} {}'.format(sample, value) for sample, value in samples)
+  return '\n'.join(lines) + '\n'
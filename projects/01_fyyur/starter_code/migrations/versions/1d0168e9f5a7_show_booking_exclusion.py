@@ -0,0 +1,40 @@
+"""end_time on shows and exclusion constraints against double booking
+
+Revision ID: 1d0168e9f5a7
+Revises: 4ce58f7ee85d
+Create Date: 2020-04-12 16:41:08.213574
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d0168e9f5a7'
+down_revision = '4ce58f7ee85d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing shows get a slot of the configured SHOW_DURATION_MINUTES.
+    # creating the constraints fails if the data already holds overlapping
+    # bookings; those have to be resolved by hand before upgrading.
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute(sa.text('''UPDATE "Show" SET end_time = start_time + :minutes * interval '1 minute' ''')
+               .bindparams(minutes=int(current_app.config['SHOW_DURATION_MINUTES'])))
+    # btree_gist lets the integer equality share a GiST index with the range
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute('''
+            ALTER TABLE "Show" ADD CONSTRAINT {}_booking_excl
+            EXCLUDE USING gist ({} WITH =, tsrange(start_time, end_time) WITH &&)
+            WHERE (start_time IS NOT NULL AND end_time IS NOT NULL)
+        '''.format(column.split('_')[0], column))
+
+
+def downgrade():
+    op.drop_constraint('artist_booking_excl', 'Show')
+    op.drop_constraint('venue_booking_excl', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,29 @@
+"""updated_at on venues, artists and shows for conditional GET
+
+Revision ID: 4ce58f7ee85d
+Revises: 61ff3878ef74
+Create Date: 2020-04-09 09:15:26.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4ce58f7ee85d'
+down_revision = '61ff3878ef74'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the server default fills existing rows and rows loaded through COPY
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,112 @@
+"""normalize venue and artist genres into lookup tables
+
+Revision ID: 61ff3878ef74
+Revises: ea46d5a570f1
+Create Date: 2020-04-05 13:48:09.773215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '61ff3878ef74'
+down_revision = 'ea46d5a570f1'
+branch_labels = None
+depends_on = None
+
+# Artist.genres held whatever the handlers wrote: '{Jazz,"Rock n Roll"}'
+# from a list, or 'Jazz,Rock n Roll' from the importer.
+ARTIST_GENRES = """
+    SELECT "Artist".id AS artist_id, btrim(name, ' "') AS name
+    FROM "Artist", regexp_split_to_table(btrim("Artist".genres, '{}'), ',') AS name
+    WHERE btrim(name, ' "') <> ''
+"""
+
+VENUE_GENRES = """
+    SELECT "Venue".id AS venue_id, name
+    FROM "Venue", unnest("Venue".genres) AS name
+    WHERE name <> ''
+"""
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index('ix_genre_name_trgm', 'Genre', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_table('venue_genres',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('genre_id', 'venue_id')
+    )
+    op.create_index('ix_venue_genres_venue_id', 'venue_genres', ['venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('genre_id', 'artist_id')
+    )
+    op.create_index('ix_artist_genres_artist_id', 'artist_genres', ['artist_id'], unique=False)
+
+    op.execute("""
+        INSERT INTO "Genre" (name)
+        SELECT name FROM ({}) AS v UNION SELECT name FROM ({}) AS a
+    """.format(VENUE_GENRES, ARTIST_GENRES))
+    op.execute("""
+        INSERT INTO venue_genres (genre_id, venue_id)
+        SELECT DISTINCT "Genre".id, v.venue_id FROM ({}) AS v JOIN "Genre" ON "Genre".name = v.name
+    """.format(VENUE_GENRES))
+    op.execute("""
+        INSERT INTO artist_genres (genre_id, artist_id)
+        SELECT DISTINCT "Genre".id, a.artist_id FROM ({}) AS a JOIN "Genre" ON "Genre".name = a.name
+    """.format(ARTIST_GENRES))
+
+    op.drop_index('ix_venue_genres_trgm', table_name='Venue')
+    op.drop_index('ix_artist_genres_trgm', table_name='Artist')
+    op.execute('DROP FUNCTION fyyur_genres_text(character varying[])')
+    op.drop_column('Venue', 'genres')
+    op.drop_column('Artist', 'genres')
+
+
+def downgrade():
+    op.add_column('Artist', sa.Column('genres', sa.String(length=120), nullable=True))
+    op.add_column('Venue', sa.Column('genres', postgresql.ARRAY(sa.String(length=120)), nullable=True))
+    op.execute("""
+        UPDATE "Venue" SET genres = g.names FROM (
+            SELECT venue_id, array_agg("Genre".name ORDER BY "Genre".name) AS names
+            FROM venue_genres JOIN "Genre" ON "Genre".id = venue_genres.genre_id
+            GROUP BY venue_id
+        ) AS g WHERE g.venue_id = "Venue".id
+    """)
+    op.execute("""
+        UPDATE "Artist" SET genres = g.names FROM (
+            SELECT artist_id, string_agg("Genre".name, ',' ORDER BY "Genre".name) AS names
+            FROM artist_genres JOIN "Genre" ON "Genre".id = artist_genres.genre_id
+            GROUP BY artist_id
+        ) AS g WHERE g.artist_id = "Artist".id
+    """)
+    op.execute("""
+        CREATE FUNCTION fyyur_genres_text(character varying[]) RETURNS text
+        AS $$ SELECT array_to_string($1, ' ') $$
+        LANGUAGE sql IMMUTABLE
+    """)
+    op.create_index(
+        'ix_artist_genres_trgm', 'Artist', ['genres'],
+        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+    op.execute(
+        'CREATE INDEX ix_venue_genres_trgm ON "Venue" '
+        'USING gin (fyyur_genres_text(genres) gin_trgm_ops)')
+    op.drop_index('ix_artist_genres_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_venue_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_index('ix_genre_name_trgm', table_name='Genre')
+    op.drop_table('Genre')
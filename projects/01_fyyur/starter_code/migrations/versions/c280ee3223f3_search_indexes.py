@@ -0,0 +1,46 @@
+"""trigram search indexes on venue and artist name, city and genres
+
+Revision ID: c280ee3223f3
+Revises: a511f00391c6
+Create Date: 2020-03-21 11:40:52.118004
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c280ee3223f3'
+down_revision = 'a511f00391c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, so it cannot back an index on its own.
+    op.execute("""
+        CREATE FUNCTION fyyur_genres_text(character varying[]) RETURNS text
+        AS $$ SELECT array_to_string($1, ' ') $$
+        LANGUAGE sql IMMUTABLE
+    """)
+    for table in ('Venue', 'Artist'):
+        for column in ('name', 'city'):
+            op.create_index(
+                'ix_{}_{}_trgm'.format(table.lower(), column), table, [column],
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    op.create_index(
+        'ix_artist_genres_trgm', 'Artist', ['genres'],
+        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+    op.execute(
+        'CREATE INDEX ix_venue_genres_trgm ON "Venue" '
+        'USING gin (fyyur_genres_text(genres) gin_trgm_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_venue_genres_trgm', table_name='Venue')
+    op.drop_index('ix_artist_genres_trgm', table_name='Artist')
+    for table in ('Venue', 'Artist'):
+        for column in ('name', 'city'):
+            op.drop_index('ix_{}_{}_trgm'.format(table.lower(), column), table_name=table)
+    op.execute('DROP FUNCTION fyyur_genres_text(character varying[])')
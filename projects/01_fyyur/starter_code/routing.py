@@ -0,0 +1,76 @@
+import random
+import time
+from functools import wraps
+from flask import g, has_app_context, has_request_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.sql import Delete, Insert, Update
+
+#----------------------------------------------------------------------------#
+# Read-replica routing.
+#
+# Views wrapped in @replica_reads run all their queries on one replica from
+# SQLALCHEMY_REPLICA_URIS, picked at random per request; everything else,
+# and every flush or DML statement, goes to the primary. A browser that has just written reads
+# from the primary for READ_YOUR_WRITES_SECONDS so it sees its own change.
+# Pages that go into the page cache are always rendered from the primary.
+#----------------------------------------------------------------------------#
+
+PRIMARY_UNTIL = 'read_primary_until'
+
+
+def replica_binds(uris):
+  # SQLALCHEMY_BINDS entries for the replicas; no model is bound to them,
+  # so create_all and the migrations only ever touch the primary
+  return {'replica_{}'.format(i): uri for i, uri in enumerate(uris)}
+
+
+def reading_primary():
+  # True while the current browser is inside its read-your-writes window
+  return has_request_context() and session.get(PRIMARY_UNTIL, 0) > time.time()
+
+
+def replica_reads(view):
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    g.use_replica = not reading_primary()
+    return view(*args, **kwargs)
+  return wrapper
+
+
+class RoutingSession(SignallingSession):
+
+  def __init__(self, db, **options):
+    self._db = db
+    super(RoutingSession, self).__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+      self.info['wrote'] = True
+    elif has_app_context() and g.get('use_replica') and self.app.config['SQLALCHEMY_REPLICA_URIS']:
+      # one replica per request: replicas replay at different speeds, and
+      # e.g. an ETag and the body it stands for must come from the same one
+      if 'replica_bind' not in g:
+        g.replica_bind = random.choice(sorted(replica_binds(self.app.config['SQLALCHEMY_REPLICA_URIS'])))
+      return self._db.get_engine(self.app, bind=g.replica_bind)
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def remember_writes(session_class, app):
+  # starts the read-your-writes window once a write has committed
+
+  def after_commit(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+      session[PRIMARY_UNTIL] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+
+  def after_rollback(db_session):
+    db_session.info.pop('wrote', None)
+
+  event.listen(session_class, 'after_commit', after_commit)
+  event.listen(session_class, 'after_rollback', after_rollback)
@@ -0,0 +1,246 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from sqlalchemy import create_engine
+
+# keep the per-request JSON log lines out of the test output
+os.environ.setdefault('REQUEST_LOG_FILE', os.devnull)
+
+from app import app, db, page_cache, replica_binds, Artist, Genre, Show, Venue
+
+
+class FyyurTestCase(unittest.TestCase):
+    """Page cache, read-replica routing and bulk import, on SQLite files"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        app.config.update(
+            TESTING=True,
+            WTF_CSRF_ENABLED=False,
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.tmp, 'primary.db'),
+            SQLALCHEMY_REPLICA_URIS=[],
+            SQLALCHEMY_BINDS={}
+        )
+        with app.app_context():
+            db.create_all()
+        page_cache.clear()
+        self.client = app.test_client
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+            for bind in app.config['SQLALCHEMY_BINDS']:
+                db.get_engine(app, bind=bind).dispose()
+        shutil.rmtree(self.tmp)
+
+    def add_venue(self, name, genres=('Jazz',)):
+        with app.app_context():
+            venue = Venue(name=name, city='San Francisco', state='CA', address='1 Main St',
+                          phone='123-123-1234', facebook_link='https://www.facebook.com/x',
+                          genres=[Genre(name=genre) for genre in genres])
+            db.session.add(venue)
+            db.session.commit()
+            return venue.id
+
+    def use_replica(self, copies=()):
+        # an empty SQLite file standing in for a replica that has not caught
+        # up with anything yet, plus one copy of the primary as it is now
+        # per name in `copies`
+        uris = []
+        for name in ('replica.db',) + tuple(copies):
+            path = os.path.join(self.tmp, name)
+            if name == 'replica.db':
+                engine = create_engine('sqlite:///' + path)
+                db.metadata.create_all(engine)
+                engine.dispose()
+            else:
+                shutil.copy(os.path.join(self.tmp, 'primary.db'), path)
+            uris.append('sqlite:///' + path)
+        app.config['SQLALCHEMY_REPLICA_URIS'] = uris
+        app.config['SQLALCHEMY_BINDS'] = replica_binds(uris)
+
+    def write_records(self, name, records):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return path
+
+    """
+    Page cache
+    """
+
+    def test_venue_page_is_cached_until_the_venue_changes(self):
+        venue_id = self.add_venue('The Musical Hop')
+        res = self.client().get('/venues/{}'.format(venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIsNotNone(page_cache.get('venue:{}:'.format(venue_id)))
+
+        with app.app_context():
+            Venue.query.get(venue_id).name = 'The Dueling Pianos Bar'
+            db.session.commit()
+
+        self.assertIsNone(page_cache.get('venue:{}:'.format(venue_id)))
+        res = self.client().get('/venues/{}'.format(venue_id))
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+    def test_bulk_delete_drops_cached_pages(self):
+        venue_id = self.add_venue('The Musical Hop')
+        self.client().get('/venues')
+        self.assertIsNotNone(page_cache.get('venues::'))
+
+        res = self.client().delete('/venues', json={'ids': [venue_id]})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['deleted'], 1)
+        self.assertIsNone(page_cache.get('venues::'))
+        self.assertNotIn(b'The Musical Hop', self.client().get('/venues').data)
+
+    def test_page_read_before_a_change_is_not_cached_after_it(self):
+        venue_id = self.add_venue('The Musical Hop')
+        with app.app_context():
+            artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+            db.session.add(artist)
+            db.session.flush()
+            db.session.add(Show(venue_id=venue_id, artist_id=artist.id,
+                                start_time=datetime(2035, 4, 1, 20)))
+            db.session.commit()
+
+        # the rows are read, but the page is only cached once it is sent
+        res = self.client().get('/shows', buffered=False)
+        with app.app_context():
+            Venue.query.get(venue_id).name = 'The Dueling Pianos Bar'
+            db.session.commit()
+        self.assertIn(b'The Musical Hop', b''.join(res.response))
+        res.close()
+
+        self.assertIsNone(page_cache.get('shows::'))
+
+    def test_400_bulk_delete_with_boolean_ids(self):
+        venue_id = self.add_venue('The Musical Hop')
+        res = self.client().delete('/venues', json={'ids': [True]})
+
+        self.assertEqual(res.status_code, 400)
+        with app.app_context():
+            self.assertIsNotNone(Venue.query.get(venue_id))
+
+    def test_400_bulk_delete_with_a_list_body(self):
+        res = self.client().delete('/venues', json=[1])
+
+        self.assertEqual(res.status_code, 400)
+
+    """
+    Read-replica routing
+    """
+
+    def test_replica_reads_until_the_browser_writes(self):
+        self.use_replica()
+        self.add_venue('The Musical Hop')
+        reader = self.client()
+        writer = self.client()
+
+        res = reader.get('/api/venues')
+        self.assertEqual(json.loads(res.data)['areas'], [])
+
+        writer.post('/venues/create', data={
+            'name': 'Park Square Live Music', 'city': 'San Francisco', 'state': 'CA',
+            'address': '34 Whiskey Moore Ave', 'phone': '415-000-1234',
+            'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/ParkSquare'})
+        res = writer.get('/api/venues')
+        names = [venue['name'] for area in json.loads(res.data)['areas'] for venue in area['venues']]
+
+        self.assertEqual(sorted(names), ['Park Square Live Music', 'The Musical Hop'])
+        self.assertEqual(json.loads(reader.get('/api/venues').data)['areas'], [])
+
+    def test_one_replica_per_request(self):
+        # replicas at different points: the ETag and the body of a response
+        # must both come from the same one
+        self.add_venue('The Musical Hop')
+        self.use_replica(copies=['caught_up.db'])
+        bodies = {}
+        for _ in range(40):
+            res = self.client().get('/api/venues')
+            bodies.setdefault(res.headers['ETag'], set()).add(res.data)
+
+        self.assertEqual(len(bodies), 2)
+        for data in bodies.values():
+            self.assertEqual(len(data), 1)
+
+    def test_api_errors_are_json(self):
+        for path, status in (('/api/venues/1000', 404), ('/api/shows?after=x_1', 400),
+                             ('/api/nothing', 404)):
+            res = self.client().get(path)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, status)
+            self.assertEqual(data['success'], False)
+            self.assertEqual(data['error'], status)
+
+        res = self.client().get('/venues/1000')
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.mimetype, 'text/html')
+
+    def test_cached_pages_are_rendered_from_the_primary(self):
+        self.use_replica()
+        self.add_venue('The Musical Hop')
+
+        res = self.client().get('/venues')
+
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'The Musical Hop', page_cache.get('venues::'))
+
+    """
+    Bulk import
+    """
+
+    def test_import_venues_rejects_invalid_records(self):
+        self.client().get('/venues')
+        path = self.write_records('venues.jsonl', [
+            {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+             'address': '1015 Folsom Street', 'genres': ['Jazz', 'Folk'],
+             'facebook_link': 'https://www.facebook.com/TheMusicalHop'},
+            {'city': 'New York', 'state': 'NY', 'address': '335 Delancey Street',
+             'genres': ['Jazz']},
+        ])
+
+        result = app.test_cli_runner().invoke(args=['import-data', 'venues', path])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('record 2:', result.output)
+        self.assertIn('1 venues inserted, 1 rejected', result.output)
+        self.assertIsNone(page_cache.get('venues::'))
+        with app.app_context():
+            venue = Venue.query.one()
+            self.assertEqual(venue.name, 'The Musical Hop')
+            self.assertEqual([genre.name for genre in venue.genres], ['Folk', 'Jazz'])
+
+    def test_import_shows_requires_a_start_time(self):
+        venue_id = self.add_venue('The Musical Hop')
+        with app.app_context():
+            artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+            db.session.add(artist)
+            db.session.commit()
+            artist_id = artist.id
+        path = self.write_records('shows.jsonl', [
+            {'artist_id': artist_id, 'venue_id': venue_id},
+            {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00:00'},
+        ])
+
+        result = app.test_cli_runner().invoke(args=['import-data', 'shows', path])
+
+        self.assertIn('1 shows inserted, 1 rejected', result.output)
+        with app.app_context():
+            show = Show.query.one()
+            self.assertEqual(show.start_time, datetime(2035, 4, 1, 20))
+            self.assertEqual(show.end_time, datetime(2035, 4, 1, 22))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import click
+
+from flaskr import create_app
+from models import db
+from .runner import (QueryCounter, format_report, http_sender, measure,
+                     regressions, scenarios, serve, test_client_sender)
+from .seed import seed, seeded
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODES = ('client', 'wsgi')
+SCENARIOS = ('questions', 'category_questions', 'search', 'quizzes')
+
+
+@click.command()
+@click.option('--database', envvar='BENCHMARK_DATABASE_URL',
+              default='sqlite:///' + os.path.join(HERE, 'trivia.db'), show_default=True,
+              help='Database to seed and run against. Its questions and categories are replaced.')
+@click.option('--questions', type=click.IntRange(1), default=10000, show_default=True,
+              help='Number of questions to seed.')
+@click.option('--reseed', is_flag=True, help='Seed even if the database already has the questions.')
+@click.option('--requests', type=click.IntRange(1), default=500, show_default=True,
+              help='Measured requests per scenario and mode.')
+@click.option('--warmup', type=click.IntRange(0), default=50, show_default=True,
+              help='Unmeasured requests before each run.')
+@click.option('--concurrency', type=click.IntRange(1), default=4, show_default=True,
+              help='Client threads in wsgi mode.')
+@click.option('--mode', 'modes', type=click.Choice(MODES), multiple=True,
+              help='client (Flask test client) or wsgi (local HTTP server). Default: both.')
+@click.option('--scenario', 'names', type=click.Choice(SCENARIOS), multiple=True,
+              help='Scenarios to run. Default: all.')
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True,
+              help='Seed for the generated rows and requests.')
+@click.option('--baseline', type=click.Path(dir_okay=False),
+              default=os.path.join(HERE, 'baseline.json'), show_default=True,
+              help='Results to compare against, if the file exists.')
+@click.option('--save-baseline', is_flag=True, help='Write the results to --baseline instead of comparing.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True,
+              help='Allowed slowdown before a latency or throughput counts as a regression.')
+@click.option('--output', type=click.File('w'), help='Also write the results as JSON to this file.')
+def main(database, questions, reseed, requests, warmup, concurrency, modes, names,
+         random_seed, baseline, save_baseline, tolerance, output):
+    """Seed a database and measure the Trivia API against it."""
+    app = create_app({'DATABASE_PATH': database})
+    with app.app_context():
+        if reseed or not seeded(questions):
+            click.echo('seeding {} questions...'.format(questions), err=True)
+            seed(questions, random_seed)
+        available = scenarios(questions)
+
+    report = {
+        'database': db.engine.dialect.name,
+        'questions': questions,
+        'results': {}
+    }
+    counter = QueryCounter(db.engine)
+    for mode in modes or MODES:
+        if mode == 'client':
+            sender, threads, server = test_client_sender(app), 1, None
+        else:
+            server = serve(app)
+            sender, threads = http_sender(server.server_port), concurrency
+        try:
+            for name in names or SCENARIOS:
+                click.echo('{} {}...'.format(mode, name), err=True)
+                report['results'].setdefault(mode, {})[name] = measure(
+                    sender, available[name], requests, warmup, threads, random_seed, counter)
+        finally:
+            if server is not None:
+                server.shutdown()
+    counter.close()
+
+    click.echo(format_report(report))
+    if output:
+        json.dump(report, output, indent=2)
+
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo('saved baseline to {}'.format(baseline))
+        return
+    if not os.path.exists(baseline):
+        return
+
+    with open(baseline) as f:
+        expected = json.load(f)
+    if (expected['database'], expected['questions']) != (report['database'], questions):
+        raise click.UsageError('the baseline was measured with {} questions on {}'.format(
+            expected['questions'], expected['database']))
+    found = regressions(report, expected, tolerance)
+    for message in found:
+        click.echo('regression: ' + message, err=True)
+    if found:
+        sys.exit(1)
+    click.echo('no regressions against {}'.format(baseline))
+
+
+if __name__ == '__main__':
+    main()
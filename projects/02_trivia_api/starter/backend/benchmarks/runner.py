@@ -0,0 +1,217 @@
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flaskr import QUESTIONS_PER_PAGE
+from flaskr.category_cache import category_cache
+from .seed import CATEGORIES, SEARCH_TERMS
+
+PERCENTILES = (50, 95, 99)
+
+# previous_questions sent with each /quizzes request, at most
+MAX_PREVIOUS_QUESTIONS = 20
+
+# queries per request may vary this much from the baseline, for requests
+# that only sometimes need a second query, before it counts as a regression
+QUERY_SLACK = 0.5
+
+
+class QueryCounter(object):
+    # counts the statements an engine executes, from any thread
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._increment)
+
+    def _increment(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def close(self):
+        event.remove(self.engine, 'before_cursor_execute', self._increment)
+
+
+def scenarios(questions):
+    # name -> function of a random.Random returning the (method, path, body)
+    # of one request. pages are spread over the whole listing, so deep
+    # OFFSETs are measured along with the first page. call inside an app
+    # context.
+    counts = category_cache.question_counts()
+    categories = [c for c in range(1, len(CATEGORIES) + 1) if counts.get(c)]
+
+    def pages(total):
+        return max(1, math.ceil(total / QUESTIONS_PER_PAGE))
+
+    def list_questions(rng):
+        return 'GET', '/questions?page={}'.format(rng.randint(1, pages(questions))), None
+
+    def category_questions(rng):
+        category_id = rng.choice(categories)
+        return 'GET', '/categories/{}/questions?page={}'.format(
+            category_id, rng.randint(1, pages(counts[category_id]))), None
+
+    def search_questions(rng):
+        return 'POST', '/questions/search', {'searchTerm': rng.choice(SEARCH_TERMS)}
+
+    def play_quiz(rng):
+        category_id = rng.choice([0] + categories)
+        previous = rng.sample(range(1, questions + 1),
+                              min(questions, rng.randint(0, MAX_PREVIOUS_QUESTIONS)))
+        return 'POST', '/quizzes', {
+            'quiz_category': {'id': category_id},
+            'previous_questions': previous
+        }
+
+    return {
+        'questions': list_questions,
+        'category_questions': category_questions,
+        'search': search_questions,
+        'quizzes': play_quiz
+    }
+
+
+def test_client_sender(app):
+    # requests through the Flask test client: the app's own cost, in process
+    def sender():
+        client = app.test_client()
+
+        def send(method, path, body):
+            return client.open(path, method=method, json=body).status_code
+        return send
+    return sender
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve(app):
+    # the app on a threaded local WSGI server; returns the server, whose
+    # shutdown() stops it
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def http_sender(port):
+    # requests over HTTP, including the server's parsing and socket costs
+    def sender():
+        def send(method, path, body):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            try:
+                headers = {}
+                if body is not None:
+                    body = json.dumps(body)
+                    headers['Content-Type'] = 'application/json'
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            finally:
+                connection.close()
+        return send
+    return sender
+
+
+def percentile(ordered, p):
+    # nearest-rank percentile of a sorted list
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def measure(sender, scenario, requests, warmup=0, concurrency=1, seed=0, counter=None):
+    # runs `requests` requests of the scenario, split over `concurrency`
+    # threads that each get their own sender, after `warmup` unmeasured ones.
+    # returns latency percentiles in milliseconds, throughput in requests
+    # per second, statements per request and the number of error responses.
+    send = sender()
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        send(*scenario(rng))
+
+    results = [None] * concurrency
+
+    def worker(index, count):
+        send = sender()
+        rng = random.Random('{}-{}'.format(seed, index))
+        latencies = []
+        errors = 0
+        for _ in range(count):
+            request = scenario(rng)
+            started = time.perf_counter()
+            status = send(*request)
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 400
+        results[index] = (latencies, errors)
+
+    threads = [threading.Thread(target=worker, args=(
+        index, requests // concurrency + (index < requests % concurrency)))
+        for index in range(concurrency)]
+    queries = counter.count if counter else 0
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    queries = counter.count - queries if counter else 0
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'throughput': len(latencies) / elapsed,
+        'queries_per_request': queries / len(latencies)
+    }
+    for p in PERCENTILES:
+        summary['p{}_ms'.format(p)] = percentile(latencies, p) * 1000
+    return summary
+
+
+def regressions(report, baseline, tolerance):
+    # a message for every result worse than the baseline's: latencies above
+    # it or throughput below it by more than `tolerance` (0.2 for 20%),
+    # more queries per request, or errors. results missing on either side
+    # are not compared.
+    found = []
+    for mode, results in report['results'].items():
+        for name, actual in results.items():
+            expected = baseline['results'].get(mode, {}).get(name)
+            if expected is None:
+                continue
+            label = '{} {}'.format(mode, name)
+            for p in PERCENTILES:
+                key = 'p{}_ms'.format(p)
+                if actual[key] > expected[key] * (1 + tolerance):
+                    found.append('{}: {} {:.2f} > baseline {:.2f}'.format(
+                        label, key, actual[key], expected[key]))
+            if actual['throughput'] < expected['throughput'] / (1 + tolerance):
+                found.append('{}: throughput {:.1f} < baseline {:.1f}'.format(
+                    label, actual['throughput'], expected['throughput']))
+            if actual['queries_per_request'] > expected['queries_per_request'] + QUERY_SLACK:
+                found.append('{}: queries per request {:.2f} > baseline {:.2f}'.format(
+                    label, actual['queries_per_request'], expected['queries_per_request']))
+            if actual['errors'] > expected['errors']:
+                found.append('{}: {} error responses'.format(label, actual['errors']))
+    return found
+
+
+def format_report(report):
+    lines = ['{} questions on {}'.format(report['questions'], report['database']),
+             '{:<8} {:<20} {:>8} {:>8} {:>8} {:>9} {:>11} {:>6}'.format(
+                 'mode', 'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries/req', 'errors')]
+    for mode, results in report['results'].items():
+        for name, result in results.items():
+            lines.append('{:<8} {:<20} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.1f} {:>11.2f} {:>6}'.format(
+                mode, name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['throughput'], result['queries_per_request'], result['errors']))
+    return '\n'.join(lines)
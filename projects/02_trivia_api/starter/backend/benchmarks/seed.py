@@ -0,0 +1,76 @@
+import random
+
+from models import db, Question, Category
+from flaskr.category_cache import category_cache
+from flaskr.sampler import question_sampler
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+# rows per INSERT while seeding
+SEED_BATCH_SIZE = 10000
+
+# question text is drawn from this vocabulary, so a search for one of the
+# words matches a predictable share of the rows. SEARCH_TERMS are common
+# enough to fill a page at any volume.
+WORDS = (
+    'actor album ancient army artist atom battle bridge capital castle '
+    'century champion chemical city coast comet composer continent crown '
+    'desert dynasty element emperor empire energy film forest fossil galaxy '
+    'gold goal island kingdom lake league medal metal molecule mountain '
+    'museum novel ocean opera orbit painter planet poem president queen '
+    'river satellite sculpture series singer species stadium star team '
+    'temple theory tournament treaty valley volcano war world'
+).split()
+SEARCH_TERMS = ('world', 'river', 'team', 'star')
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+def seed(questions, seed=0):
+    # replaces the categories and questions of the app's database with the
+    # six standard categories and `questions` generated questions, spread
+    # evenly over categories and difficulties. the same seed gives the same
+    # rows. call inside an app context.
+    rng = random.Random(seed)
+    db.session.query(Question).delete(synchronize_session=False)
+    db.session.query(Category).delete(synchronize_session=False)
+    db.session.execute(Category.__table__.insert(), [
+        {'id': category_id, 'type': type}
+        for category_id, type in enumerate(CATEGORIES, 1)])
+    db.session.commit()
+
+    inserted = 0
+    while inserted < questions:
+        count = min(SEED_BATCH_SIZE, questions - inserted)
+        db.session.execute(Question.__table__.insert(), [{
+            'id': question_id,
+            'question': sentence(rng, rng.randint(6, 14)) + '?',
+            'answer': sentence(rng, rng.randint(1, 3)),
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5)
+        } for question_id in range(inserted + 1, inserted + count + 1)])
+        db.session.commit()
+        inserted += count
+
+    # core inserts skip the session events that keep these up to date
+    category_cache.invalidate()
+    question_sampler.invalidate()
+
+    if db.engine.dialect.name == 'postgresql':
+        # explicit ids leave the sequences behind, and the planner needs
+        # statistics for the new rows
+        for table in ('categories', 'questions'):
+            db.session.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT max(id) FROM {0}))".format(table))
+        db.session.execute('ANALYZE categories, questions')
+        db.session.commit()
+
+
+def seeded(questions):
+    # whether the database already holds exactly the rows seed() would write
+    return db.session.query(Category).count() == len(CATEGORIES) and \
+        db.session.query(Question).count() == questions and \
+        db.session.query(db.func.max(Question.id)).scalar() == questions
@@ -1,51 +1,177 @@
+import math
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, or_
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question
+from .bulk import export_questions, ingest_questions, validate_question
+from .category_cache import category_cache
+from .quiz_sessions import QuizSessionStore, permuted_deck, shuffled_deck, upcoming
+from .sampler import adaptive_weights, question_sampler
 
 QUESTIONS_PER_PAGE = 10
 
+# quiz sessions expire after this many seconds without a question drawn
+QUIZ_SESSION_TTL = int(os.environ.get('QUIZ_SESSION_TTL', 3600))
 
-def paginate(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    formatted_questions = [q.format() for q in selection]
-    current_questions = formatted_questions[start:end]
-    return current_questions
+# questions expected per query when drawing from a quiz session's deck
+QUIZ_DECK_BATCH = 20
 
+# categories holding less than this share of their id range get an
+# explicit list of ids as their deck instead of a permutation of the range
+QUIZ_DECK_MIN_DENSITY = 1 / 64
 
-def __get_categories():
-    all_categories = Category.query.order_by(Category.id).all()
-    categories = {}
-    for category in all_categories:
-        categories[category.id] = category.type
-    return categories
+# random ids looked up at once when drawing a /quizzes question
+QUIZ_RANDOM_PROBES = 20
 
+# id ranges up to this size always get an explicit deck: it takes a few
+# kilobytes, and the permutation is not uniform over so few ids
+QUIZ_DECK_MIN_PERMUTED = 1024
 
-def __get_questions_by_category(category_id):
-    if category_id == '':
-        abort(400)
 
-    if category_id != 0:
-        questions = Question.query.filter
-        (Question.category == category_id).all()
+def paginate(request, query, total=None):
+    # one page of the query's questions, ordered by id, with the total count
+    # (counted unless the caller already knows it) and the `after` value of
+    # the next page (None on the last one).
+    # ?page=N skips the earlier pages with OFFSET; ?after=<id> starts right
+    # after the last id of the previous page instead, an index range scan
+    # that costs the same on page 1 and on page 100000.
+    if total is None:
+        total = query.with_entities(func.count(Question.id)).order_by(None).scalar()
+
+    query = query.order_by(Question.id)
+    after = request.args.get('after', None, type=int)
+    if after is not None:
+        query = query.filter(Question.id > after)
     else:
-        questions = Question.query.all()
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            return [], total, None
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+    current_questions = [q.format() for q in query.limit(QUESTIONS_PER_PAGE)]
+    next_after = None
+    if len(current_questions) == QUESTIONS_PER_PAGE:
+        next_after = current_questions[-1]['id']
+    return current_questions, total, next_after
+
+
+def like_pattern(term):
+    # '%term%' with the LIKE wildcards in the user's input escaped by a
+    # backslash, which the query must name with escape='\\': only
+    # PostgreSQL uses it by default
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + term + '%'
+
+
+def __search_questions(term, category_id=None, page=1):
+    # one page of the questions whose text or answer contains the term, and
+    # the total number of matches, counted by the same query. substring
+    # ILIKE is served by the trigram indexes on both columns.
+    pattern = like_pattern(term)
+    query = Question.query.filter(or_(
+        Question.question.ilike(pattern, escape='\\'),
+        Question.answer.ilike(pattern, escape='\\')))
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    rows = query.add_columns(func.count().over()) \
+        .order_by(Question.id) \
+        .limit(QUESTIONS_PER_PAGE) \
+        .offset((page - 1) * QUESTIONS_PER_PAGE) \
+        .all()
+    if rows:
+        total = rows[0][1]
+    else:
+        # past the last page the window count has no row to ride on
+        total = query.count() if page > 1 else 0
+    return [question.format() for question, _ in rows], total
 
-    if not questions:
-        abort(400)
 
-    return [q.format() for q in questions]
+def __category_questions(category_id):
+    # the questions of a category, or all of them for category 0
+    query = Question.query
+    if category_id != 0:
+        query = query.filter(Question.category == category_id)
+    return query
+
+
+def __id_range(query):
+    # lowest and highest question id of the query; 400 when it is empty
+    low, high = query.with_entities(func.min(Question.id), func.max(Question.id)).one()
+    if low is None:
+        abort(400)
+    return low, high
+
+
+def __new_deck(query):
+    # the shuffled deck of a quiz session. a permutation of the category's
+    # id range costs no memory; the batch grows with the share of ids in
+    # the range that belong to other categories.
+    low, high = __id_range(query)
+    count = query.with_entities(func.count(Question.id)).order_by(None).scalar()
+    size = high - low + 1
+    if size <= QUIZ_DECK_MIN_PERMUTED or count < size * QUIZ_DECK_MIN_DENSITY:
+        ids = [question_id for question_id, in query.with_entities(Question.id)]
+        return shuffled_deck(ids, QUIZ_DECK_BATCH)
+    return permuted_deck(low, high, QUIZ_DECK_BATCH * math.ceil(size / count))
+
+
+def __draw_from_deck(category_id, deck):
+    # the next question of a quiz session's deck, or None at its end.
+    # questions deleted since the deck was dealt are skipped.
+    query = __category_questions(category_id)
+    while deck['position'] < deck['size']:
+        ids = upcoming(deck)
+        found = {q.id: q for q in query.filter(Question.id.in_(ids))}
+        for index, question_id in enumerate(ids):
+            if question_id in found:
+                deck['position'] += index + 1
+                return found[question_id]
+        deck['position'] += len(ids)
+    return None
+
+
+def __get_random_question(category_id, previous_questions):
+    # a random question of the category (0 for all) that is not in
+    # previous_questions, or None once every question has been played.
+    # instead of loading the category, look up QUIZ_RANDOM_PROBES random
+    # ids between its lowest and highest and pick one of the unplayed
+    # questions among them, each of which is then equally likely. only if
+    # none hits, which gets likely once most of the range is played or
+    # belongs to other categories, take the first unplayed question from a
+    # random id on, wrapping around to the start. that fallback is biased:
+    # a question is drawn as often as the gap of missing or played ids in
+    # front of it is long, and its NOT IN grows with previous_questions.
+    query = __category_questions(category_id)
+    low, high = __id_range(query)
+    played = set(previous_questions)
+
+    probes = {random.randint(low, high) for _ in range(QUIZ_RANDOM_PROBES)}
+    found = [q for q in query.filter(Question.id.in_(probes)) if q.id not in played]
+    if found:
+        return random.choice(found)
+
+    if previous_questions:
+        query = query.filter(~Question.id.in_(previous_questions))
+
+    pivot = random.randint(low, high)
+    question = query.filter(Question.id >= pivot).order_by(Question.id).first()
+    if question is None:
+        question = query.filter(Question.id < pivot).order_by(Question.id).first()
+    return question
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    test_config = test_config or {}
+    setup_db(app, test_config.get('DATABASE_PATH', database_path))
+
+    quiz_sessions = test_config.get('QUIZ_SESSION_STORE') or QuizSessionStore(ttl=QUIZ_SESSION_TTL)
 
     '''
     @TODO: Set up CORS. Allow '*' for origins.
@@ -73,14 +199,14 @@ def create_app(test_config=None):
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        categories = __get_categories()
-        print(len(categories))
+        categories = category_cache.categories()
         if len(categories) == 0:
             abort(404)
         else:
             return jsonify({
                 'success': True,
-                'categories': categories
+                'categories': categories,
+                'question_counts': category_cache.question_counts()
               })
 
     '''
@@ -99,12 +225,12 @@ def create_app(test_config=None):
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate(request, selection)
+        current_questions, total, next_after = paginate(
+            request, Question.query, category_cache.total_questions())
         if len(current_questions) == 0:
             abort(404)
 
-        categories = __get_categories()
+        categories = category_cache.categories()
         # length = len(current_questions)
         # current_category = []
         # for i in range(length):
@@ -117,7 +243,8 @@ def create_app(test_config=None):
         return jsonify({
             'success': True,
             'current_questions': current_questions,
-            'total_questions': len(selection),
+            'total_questions': total,
+            'next_after': next_after,
             # 'current_category': current_category,
             'categories': categories
         })
@@ -161,14 +288,13 @@ def create_app(test_config=None):
 
             question.delete()
 
-            selection = Question.query.all()
-            current_questions = paginate(request, selection)
+            current_questions, total, next_after = paginate(request, Question.query)
 
             return jsonify({
               'success': True,
               'deleted_question': question.id,
               'current_questions': current_questions,
-              'total_questions': len(selection)
+              'total_questions': total
             })
         except:
             abort(422)
@@ -188,48 +314,81 @@ def create_app(test_config=None):
     @app.route('/questions', methods=['POST'])
     def add_question():
         body = request.get_json()
-
-        new_question = body.get('question', None)
-        new_answer = body.get('answer', None)
-        new_category = body.get('category', None)
-        new_difficulty = body.get('difficulty', None)
+        if not isinstance(body, dict):
+            abort(400)
         search = body.get('search', None)
 
+        if search is None:
+            # the frontend sends the category and difficulty as strings;
+            # anything that is not a number at all is a bad request
+            for value in (body.get('category'), body.get('difficulty')):
+                if isinstance(value, bool):
+                    abort(400)
+                try:
+                    if value is not None:
+                        int(value)
+                except (TypeError, ValueError):
+                    abort(400)
+            # the same rules as POST /questions/bulk
+            new_question, errors = validate_question(body, category_cache.categories())
+            if errors:
+                abort(422)
+
         try:
             if search is not None:
-                selection = Question.query.filter(Question.question.ilike('%{}%'.format(search)))
-                current_questions = paginate(request, selection)
+                page = request.args.get('page', 1, type=int)
+                current_questions, total = __search_questions(search, page=max(page, 1))
 
                 return jsonify({
                     'success': True,
                     'search_questions': current_questions,
-                    'total_questions': len(selection.all())
+                    'total_questions': total
                 })
 
             else:
-                if not new_question or not new_answer or not new_category or not new_difficulty:
-                    abort(400)
-
-                question = Question(
-                    question=new_question,
-                    answer=new_answer,
-                    category=new_category,
-                    difficulty=new_difficulty
-                    )
+                question = Question(**new_question)
 
                 question.insert()
 
-                selection = Question.query.all()
-                current_questions = paginate(request, selection)
+                current_questions, total, next_after = paginate(request, Question.query)
 
                 return jsonify({
                     'success': True,
                     'current_questions': current_questions,
-                    'total_questions': len(selection)
+                    'total_questions': total
                     })
         except:
             abort(422)
 
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_add_questions():
+        # JSON lines body, read as it arrives
+        summary = ingest_questions(request.stream)
+        return jsonify(dict(summary, success=True))
+
+    @app.route('/questions/export', methods=['GET'])
+    def export_all_questions():
+        return Response(
+            stream_with_context(export_questions()),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': 'attachment; filename=questions.jsonl'})
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.File('rb'))
+    def import_questions_command(path):
+        """Load questions from a JSON-lines file ('-' for stdin)."""
+        summary = ingest_questions(path)
+        for error in summary['errors']:
+            click.echo('line {}: {}'.format(error['line'], error['errors']), err=True)
+        click.echo('{} inserted, {} rejected'.format(summary['inserted'], summary['rejected']))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.File('w'), default='-')
+    def export_questions_command(path):
+        """Write every question as JSON lines to a file (stdout by default)."""
+        for line in export_questions():
+            path.write(line)
+
     '''
     @TODO:
     Create a POST endpoint to get questions based on a search term.
@@ -262,6 +421,35 @@ def create_app(test_config=None):
     #     except:
     #         abort(422)
 
+    @app.route('/questions/search', methods=['POST'])
+    def search_questions():
+        body = request.get_json(silent=True) or {}
+        term = body.get('searchTerm', body.get('search'))
+        category_id = body.get('category')
+        page = request.args.get('page', 1, type=int)
+
+        if not isinstance(term, str) or not term.strip() or page < 1:
+            abort(400)
+
+        current_category = None
+        if category_id is not None:
+            try:
+                category_id = int(category_id)
+            except (TypeError, ValueError):
+                abort(400)
+            current_category = category_cache.categories().get(category_id)
+            if current_category is None:
+                abort(400)
+
+        current_questions, total = __search_questions(term.strip(), category_id, page)
+
+        return jsonify({
+            'success': True,
+            'questions': current_questions,
+            'total_questions': total,
+            'current_category': current_category
+        })
+
     '''
     @TODO:
     Create a GET endpoint to get questions based on category.
@@ -274,21 +462,22 @@ def create_app(test_config=None):
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_questions_based_on_category(category_id):
         try:
-            category = Category.query.filter(Category.id == category_id).one_or_none()
-            if not category:
+            current_category = category_cache.categories().get(category_id)
+            if not current_category:
                 abort(400)
 
-            selection = Question.query.filter(Question.category == category_id).all()
-            if not selection:
+            selection = Question.query.filter(Question.category == category_id)
+            current_questions, total, next_after = paginate(
+                request, selection, category_cache.question_counts().get(category_id, 0))
+            if not total:
                 abort(404)
 
-            current_questions = paginate(request, selection)
-
             return jsonify({
                 'success': True,
                 'questions': current_questions,
-                'total_questions': len(selection),
-                'current_category': category.type
+                'total_questions': total,
+                'next_after': next_after,
+                'current_category': current_category
             })
         except:
             abort(400)
@@ -307,43 +496,31 @@ def create_app(test_config=None):
 
     @app.route('/quizzes', methods=['POST'])
     def play_trivia():
-        body = request.get_json()
-        # quiz_category = body.get('quiz_category')
-        # category_id = quiz_category.get('id', None)
-        category_id = body.get('id', None)
-        previous_questions = body.get('pervious_questions', [])
-
-        questions = __get_questions_by_category(category_id)
-        if len(questions) == 0:
-            abort(404)
-        current_question = random.choice(questions)
-        keep_playing = True
+        body = request.get_json(silent=True) or {}
+        # the frontend sends quiz_category: {type, id}, older clients a bare id
+        quiz_category = body.get('quiz_category')
+        if isinstance(quiz_category, dict):
+            category_id = quiz_category.get('id', '')
+        else:
+            category_id = body.get('id', '')
+        previous_questions = body.get('previous_questions', body.get('pervious_questions', []))
 
         try:
-            while keep_playing:
-                if current_question.get('id') not in previous_questions:
-                    print('plaplapla')
-                    return jsonify({
-                            "success": True,
-                            "status_code": 200,
-                            "status_message": "OK",
-                            "question": current_question
-                        })
-                else:
-                    if len(questions) > len(previous_questions):
-                        current_question = random.choice(questions)
-                    else:
-                        keep_playing = False
+            category_id = int(category_id)
+        except (TypeError, ValueError):
+            abort(400)
+        if not isinstance(previous_questions, list) or \
+                not all(isinstance(q, int) for q in previous_questions):
+            abort(400)
 
-            return jsonify({
-                    "success": True,
-                    "status_code": 200,
-                    "status_message": "OK",
-                    "question": current_question
-            })
+        question = __get_random_question(category_id, previous_questions)
 
-        except:
-            abort(400)
+        return jsonify({
+                "success": True,
+                "status_code": 200,
+                "status_message": "OK",
+                "question": question.format() if question else None
+        })
 
         # if len(questions) > 0:
         #     question = random.choice(questions)
@@ -354,6 +531,106 @@ def create_app(test_config=None):
         # else:
         #     abort(404)
 
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
+        quiz_category = body.get('quiz_category')
+        if isinstance(quiz_category, dict):
+            category_id = quiz_category.get('id', '')
+        else:
+            category_id = body.get('category', '')
+
+        try:
+            category_id = int(category_id)
+        except (TypeError, ValueError):
+            abort(400)
+
+        session_id = quiz_sessions.create({
+            'category': category_id,
+            'deck': __new_deck(__category_questions(category_id)),
+            'played': 0
+        })
+
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'category': category_id
+        }), 201
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        state = quiz_sessions.get(session_id)
+        if state is None:
+            abort(404)
+
+        question = __draw_from_deck(state['category'], state['deck'])
+        if question is not None:
+            state['played'] += 1
+        quiz_sessions.save(session_id, state)
+
+        return jsonify({
+            'success': True,
+            'question': question.format() if question else None,
+            'questions_played': state['played']
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        if not quiz_sessions.delete(session_id):
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
+    @app.route('/quizzes/sample', methods=['POST'])
+    def sample_quiz_question():
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400)
+        quiz_category = body.get('quiz_category')
+        categories = body.get('categories')
+        if categories is None and isinstance(quiz_category, dict):
+            categories = [quiz_category.get('id', '')]
+        previous_questions = body.get('previous_questions', [])
+
+        # a string would otherwise be read one character per category
+        if categories is not None and not isinstance(categories, list):
+            abort(400)
+        try:
+            categories = [int(c) for c in categories or []]
+            weights = {int(d): float(w) for d, w in
+                       (body.get('difficulty_weights') or {}).items()}
+        except (AttributeError, TypeError, ValueError):
+            abort(400)
+        # float() accepts "inf" and "nan", which no draw can use
+        if any(not math.isfinite(w) or w < 0 for w in weights.values()) or \
+                not isinstance(previous_questions, list) or \
+                not all(isinstance(q, int) for q in previous_questions):
+            abort(400)
+        if body.get('mode') == 'adaptive':
+            answers = body.get('previous_answers', [])
+            if not isinstance(answers, list) or \
+                    not all(isinstance(a, bool) for a in answers):
+                abort(400)
+            weights = adaptive_weights(answers)
+
+        # no categories, or category 0 ("All"), draws from every category
+        if not categories or 0 in categories:
+            categories = None
+        elif any(c not in category_cache.categories() for c in categories):
+            abort(400)
+
+        question_id = question_sampler.draw(set(categories) if categories else None,
+                                            weights or None, set(previous_questions))
+        question = Question.query.get(question_id) if question_id is not None else None
+
+        return jsonify({
+            'success': True,
+            'question': question.format() if question else None
+        })
+
     '''
     @TODO:
     Create error handlers for all expected errors
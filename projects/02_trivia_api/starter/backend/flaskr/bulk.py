@@ -0,0 +1,128 @@
+import json
+
+from models import db, Question
+from .category_cache import category_cache
+from .sampler import question_sampler
+
+# rows per INSERT transaction on import, and per SELECT on export
+BULK_BATCH_SIZE = 1000
+
+# per-row errors included in an import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+DIFFICULTIES = range(1, 6)
+
+
+def integer(value):
+    # int() of a number or numeric string; JSON true and false are not
+    # numbers here, though int() takes them
+    if isinstance(value, bool):
+        raise TypeError('expected a number')
+    return int(value)
+
+
+def validate_question(record, categories):
+    # (row, None) ready for insertion, or (None, errors) keyed by field
+    if not isinstance(record, dict):
+        return None, {'record': 'expected a JSON object'}
+
+    errors = {}
+    for field in ('question', 'answer'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors[field] = 'required'
+
+    try:
+        category = integer(record.get('category'))
+    except (TypeError, ValueError):
+        errors['category'] = 'required'
+    else:
+        if category not in categories:
+            errors['category'] = 'unknown category {}'.format(category)
+
+    try:
+        difficulty = integer(record.get('difficulty'))
+    except (TypeError, ValueError):
+        errors['difficulty'] = 'required'
+    else:
+        if difficulty not in DIFFICULTIES:
+            errors['difficulty'] = 'must be between 1 and 5'
+
+    if errors:
+        return None, errors
+    return {
+        'question': record['question'].strip(),
+        'answer': record['answer'].strip(),
+        'category': category,
+        'difficulty': difficulty
+    }, None
+
+
+def ingest_questions(lines, batch_size=BULK_BATCH_SIZE):
+    # inserts questions from JSON lines (str or bytes), one transaction per
+    # batch. invalid rows are reported and skipped without failing the rest;
+    # a batch the database rejects is rolled back and reported as a whole.
+    categories = category_cache.categories()
+    summary = {'inserted': 0, 'rejected': 0, 'errors': []}
+
+    def reject(line, errors, count=1):
+        summary['rejected'] += count
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line, 'errors': errors})
+
+    def insert(batch):
+        try:
+            db.session.execute(Question.__table__.insert(), [row for _, row in batch])
+            db.session.commit()
+            summary['inserted'] += len(batch)
+        except Exception as e:
+            db.session.rollback()
+            reject(batch[0][0], {'batch': 'lines {}-{} not inserted: {}'.format(
+                batch[0][0], batch[-1][0], e)}, len(batch))
+
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            reject(number, {'record': 'invalid JSON'})
+            continue
+        row, errors = validate_question(record, categories)
+        if errors:
+            reject(number, errors)
+            continue
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            insert(batch)
+            batch = []
+    if batch:
+        insert(batch)
+
+    # core inserts skip the session events that keep these up to date
+    if summary['inserted']:
+        category_cache.invalidate()
+        question_sampler.invalidate()
+    return summary
+
+
+def export_questions(batch_size=BULK_BATCH_SIZE):
+    # every question as a JSON line, in id order. reads batch_size rows at a
+    # time past the last id seen, as plain tuples that the session does not
+    # keep, so memory stays flat however large the table is.
+    columns = (Question.id, Question.question, Question.answer,
+               Question.category, Question.difficulty)
+    after = None
+    while True:
+        query = db.session.query(*columns).order_by(Question.id)
+        if after is not None:
+            query = query.filter(Question.id > after)
+        rows = query.limit(batch_size).all()
+        if not rows:
+            return
+        for row in rows:
+            yield json.dumps(row._asdict()) + '\n'
+        after = rows[-1].id
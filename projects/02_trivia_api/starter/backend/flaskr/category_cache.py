@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, Question, Category
+
+# seconds a worker keeps its copy; bounds how long other workers' writes
+# take to show up
+CATEGORY_CACHE_TTL = int(os.environ.get('CATEGORY_CACHE_TTL', 60))
+
+
+class CategoryCache(object):
+    # the category id -> type map and the number of questions per category,
+    # loaded together and kept for `ttl` seconds. a commit that adds,
+    # changes or deletes questions or categories drops the copy of this
+    # process right away. the returned dicts are shared: do not modify them.
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        entry = self._entry
+        if entry is not None and entry[0] > time.time():
+            return entry
+        with self._lock:
+            if self._entry is not entry:
+                # another thread reloaded it meanwhile
+                return self._entry
+            categories = {c.id: c.type for c in Category.query.order_by(Category.id)}
+            rows = db.session.query(Question.category, func.count(Question.id)) \
+                .group_by(Question.category)
+            counts = {}
+            total = 0
+            for category, count in rows:
+                total += count
+                if category is not None:
+                    counts[category] = count
+            self._entry = (time.time() + self.ttl, categories, counts, total)
+            return self._entry
+
+    def categories(self):
+        return self._load()[1]
+
+    def question_counts(self):
+        # category id -> number of questions, for categories that have any
+        return self._load()[2]
+
+    def total_questions(self):
+        return self._load()[3]
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+
+category_cache = CategoryCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def mark_category_cache_stale(session, flush_context):
+    for instance in set(session.new) | set(session.dirty) | set(session.deleted):
+        if isinstance(instance, (Question, Category)):
+            session.info['category_cache_stale'] = True
+            return
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def mark_category_cache_stale_bulk(update_context):
+    if update_context.mapper.class_ in (Question, Category):
+        update_context.session.info['category_cache_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_category_cache(session):
+    if session.info.pop('category_cache_stale', False):
+        category_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_category_cache_mark(session):
+    session.info.pop('category_cache_stale', None)
@@ -0,0 +1,118 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class QuizSessionStore(object):
+    # in-process quiz sessions, dropped `ttl` seconds after their last use.
+    # any object with the same create/get/save/delete methods (for example
+    # one backed by Redis, to share sessions between workers) can be passed
+    # to create_app as QUIZ_SESSION_STORE instead.
+
+    def __init__(self, ttl=3600, max_sessions=100000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # sessions are kept in order of last use, so expired ones are in front
+        while self._sessions:
+            session_id, (expires, _) = next(iter(self._sessions.items()))
+            if expires > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def create(self, state):
+        session_id = secrets.token_urlsafe(16)
+        self.save(session_id, state)
+        return session_id
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (now + self.ttl, entry[1])
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def save(self, session_id, state):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now + self.ttl, state)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+# Feistel rounds of permuted_deck. six make the order of ranges above a
+# few hundred ids indistinguishable from a shuffle in a chi-squared test;
+# much smaller ranges stay biased at any practical count.
+DECK_ROUNDS = 6
+
+
+def permuted_deck(low, high, batch):
+    # a shuffled deck of the ids low..high that is never materialized:
+    # position i maps to low + permute(deck, i), a keyed Feistel network over
+    # the smallest even number of bits that covers the range, so the deck is
+    # a few integers. ids missing from the category are skipped when
+    # drawing, `batch` at a time.
+    size = high - low + 1
+    half = max(1, (size - 1).bit_length() + 1) // 2
+    return {'low': low, 'size': size, 'half': half,
+            'keys': [random.getrandbits(64) for _ in range(DECK_ROUNDS)],
+            'position': 0, 'batch': batch}
+
+
+def _round(value, key, mask):
+    # the Feistel round function: any keyed mix of the half block will do
+    # mix, splitmix64's finalizer
+    value ^= key
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return (value ^ (value >> 31)) & mask
+
+
+def permute(deck, position):
+    # the network permutes 0..4**half - 1; values outside the deck are fed
+    # through it again (cycle-walking) until one lands inside, which keeps
+    # it a permutation of 0..size - 1. the range is under four times the
+    # size, so that takes fewer than four passes on average.
+    half, keys = deck['half'], deck['keys']
+    mask = (1 << half) - 1
+    value = position
+    while True:
+        left, right = value >> half, value & mask
+        for key in keys:
+            left, right = right, left ^ _round(right, key, mask)
+        value = (left << half) | right
+        if value < deck['size']:
+            return value
+
+
+def shuffled_deck(ids, batch):
+    # an explicit shuffled deck, for categories whose questions are too
+    # sparse within their id range for permuted_deck to find them quickly,
+    # or whose range is too small for it to be uniform
+    ids = array('l', ids)
+    random.shuffle(ids)
+    return {'ids': ids, 'size': len(ids), 'position': 0, 'batch': batch}
+
+
+def upcoming(deck):
+    # the next ids of the deck; the caller advances deck['position'] past
+    # the ones it has used
+    start = deck['position']
+    end = min(start + deck['batch'], deck['size'])
+    if 'ids' in deck:
+        return deck['ids'][start:end].tolist()
+    return [deck['low'] + permute(deck, i) for i in range(start, end)]
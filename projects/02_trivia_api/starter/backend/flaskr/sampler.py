@@ -0,0 +1,182 @@
+import os
+import random
+import threading
+import time
+from array import array
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Question
+
+# seconds between full reloads, which pick up other workers' writes
+SAMPLER_TTL = int(os.environ.get('SAMPLER_TTL', 300))
+
+DIFFICULTIES = range(1, 6)
+
+# random probes of a pool before falling back to scanning it for an unseen id
+PICK_ATTEMPTS = 8
+
+# answers considered by adaptive_weights
+ADAPTIVE_WINDOW = 10
+
+
+def adaptive_weights(answers):
+    # difficulty weights for the next question given the previous answers
+    # (True for correct): a staircase starting at difficulty 1 that steps up
+    # after a correct answer and down after a miss, with the weight halving
+    # per step away from the current level
+    level = 1
+    for correct in answers[-ADAPTIVE_WINDOW:]:
+        level = min(level + 1, DIFFICULTIES[-1]) if correct else max(level - 1, DIFFICULTIES[0])
+    return {difficulty: 2.0 ** -abs(difficulty - level) for difficulty in DIFFICULTIES}
+
+
+def pool_key(category, difficulty):
+    # the (category, difficulty) pool of a question, as ints whatever type
+    # the attributes were set with, or None when it belongs in no pool
+    try:
+        return int(category), int(difficulty)
+    except (TypeError, ValueError):
+        return None
+
+
+def pick(pool, exclude):
+    # a random id of the pool that is not excluded, or None. random probes
+    # almost always succeed; the scan only runs once most of the pool is seen
+    for _ in range(PICK_ATTEMPTS):
+        question_id = pool[random.randrange(len(pool))]
+        if question_id not in exclude:
+            return question_id
+    unseen = [question_id for question_id in pool if question_id not in exclude]
+    return random.choice(unseen) if unseen else None
+
+
+class QuestionSampler(object):
+    # the ids of all questions, in one array per (category, difficulty).
+    # loaded from the database on first use and every `ttl` seconds, and
+    # kept up to date in between by the commits of this process.
+
+    def __init__(self, ttl=SAMPLER_TTL):
+        self.ttl = ttl
+        self._pools = None
+        self._expires = 0
+        self._lock = threading.RLock()
+
+    def _load(self):
+        pools = {}
+        rows = db.session.query(Question.id, Question.category, Question.difficulty)
+        for question_id, category, difficulty in rows:
+            key = pool_key(category, difficulty)
+            if key is not None:
+                pools.setdefault(key, array('l')).append(question_id)
+        self._pools = pools
+        self._expires = time.time() + self.ttl
+
+    def add(self, question_id, category, difficulty):
+        key = pool_key(category, difficulty)
+        with self._lock:
+            if self._pools is not None and key is not None:
+                self._pools.setdefault(key, array('l')).append(question_id)
+
+    def remove(self, question_id, category, difficulty):
+        # swap the last id into the removed one's place
+        key = pool_key(category, difficulty)
+        with self._lock:
+            if self._pools is None or key is None:
+                return
+            pool = self._pools.get(key)
+            try:
+                index = pool.index(question_id)
+            except (AttributeError, ValueError):
+                return
+            pool[index] = pool[-1]
+            pool.pop()
+
+    def invalidate(self):
+        with self._lock:
+            self._pools = None
+
+    def draw(self, categories=None, weights=None, exclude=()):
+        # a random question id from the given categories (None for all),
+        # not in exclude. the difficulty is chosen first, in proportion to
+        # `weights` (difficulty -> weight, all equal by default), then a
+        # category in proportion to its questions of that difficulty.
+        # returns None when every candidate is excluded.
+        weights = weights or dict.fromkeys(DIFFICULTIES, 1)
+        with self._lock:
+            if self._pools is None or time.time() > self._expires:
+                self._load()
+            by_difficulty = {}
+            for (category, difficulty), pool in self._pools.items():
+                if pool and weights.get(difficulty, 0) > 0 and \
+                        (categories is None or category in categories):
+                    by_difficulty.setdefault(difficulty, []).append(pool)
+
+            while by_difficulty:
+                difficulties = list(by_difficulty)
+                difficulty = random.choices(
+                    difficulties, [weights[d] for d in difficulties])[0]
+                pools = by_difficulty[difficulty]
+                pool = random.choices(pools, [len(p) for p in pools])[0]
+                question_id = pick(pool, exclude)
+                if question_id is not None:
+                    return question_id
+                # every id of this pool has been played
+                pools.remove(pool)
+                if not pools:
+                    del by_difficulty[difficulty]
+            return None
+
+
+question_sampler = QuestionSampler()
+
+
+@event.listens_for(Session, 'after_flush')
+def record_sampler_changes(session, flush_context):
+    # applied on commit, so a rolled back change never reaches the pools
+    changes = session.info.setdefault('sampler_changes', [])
+
+    def record(change, question_id, category, difficulty):
+        key = pool_key(category, difficulty)
+        if key is not None:
+            changes.append((change, question_id) + key)
+
+    for instance in session.new:
+        if isinstance(instance, Question):
+            record(question_sampler.add, instance.id, instance.category, instance.difficulty)
+    for instance in session.deleted:
+        if isinstance(instance, Question):
+            record(question_sampler.remove, instance.id, instance.category, instance.difficulty)
+    for instance in session.dirty:
+        if isinstance(instance, Question):
+            attrs = inspect(instance).attrs
+            category, difficulty = attrs.category.history, attrs.difficulty.history
+            if category.has_changes() or difficulty.has_changes():
+                record(question_sampler.remove, instance.id,
+                       (category.deleted or [instance.category])[0],
+                       (difficulty.deleted or [instance.difficulty])[0])
+                record(question_sampler.add, instance.id, instance.category, instance.difficulty)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def mark_sampler_stale(update_context):
+    # the changed rows are unknown, so the pools are reloaded instead
+    if update_context.mapper.class_ is Question:
+        update_context.session.info['sampler_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_sampler_changes(session):
+    changes = session.info.pop('sampler_changes', ())
+    if session.info.pop('sampler_stale', False):
+        question_sampler.invalidate()
+        return
+    for change, question_id, category, difficulty in changes:
+        change(question_id, category, difficulty)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_sampler_changes(session):
+    session.info.pop('sampler_changes', None)
+    session.info.pop('sampler_stale', None)
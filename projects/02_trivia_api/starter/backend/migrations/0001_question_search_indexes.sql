@@ -0,0 +1,15 @@
+-- Trigram indexes for POST /questions/search, which matches the search term
+-- anywhere in the question or the answer (ILIKE '%term%').
+--
+-- Run once against an existing database:
+--   psql trivia < migrations/0001_question_search_indexes.sql
+-- CONCURRENTLY keeps the table writable while the indexes build, so this
+-- file must not be wrapped in a transaction.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_question_trgm
+    ON questions USING gin (question gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_answer_trgm
+    ON questions USING gin (answer gin_trgm_ops);
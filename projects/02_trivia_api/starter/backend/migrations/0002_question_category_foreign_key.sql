@@ -0,0 +1,42 @@
+-- Makes questions.category an integer foreign key to categories.id and adds
+-- the composite indexes behind the category listing and the quiz filters:
+--   (category, id)          GET /categories/<id>/questions pages and the
+--                           quiz id range lookups, read in id order
+--   (category, difficulty)  the per-category, per-difficulty counts and
+--                           quiz question pools
+-- The first also serves every plain lookup on category.
+--
+-- Run once against an existing database:
+--   psql trivia < migrations/0002_question_category_foreign_key.sql
+-- Databases loaded from trivia.psql already have an integer column and the
+-- foreign key; those steps are skipped. Databases created by db.create_all()
+-- before this change have a varchar column, which is rewritten under an
+-- exclusive lock: run it in a quiet moment. Values that are not category
+-- ids make the cast or the foreign key fail, and nothing is changed.
+-- The indexes are built CONCURRENTLY afterwards, so this file must not be
+-- wrapped in a transaction.
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE questions
+            ALTER COLUMN category TYPE integer USING NULLIF(trim(category), '')::integer;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'questions'::regclass AND contype = 'f') THEN
+        ALTER TABLE questions
+            ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES categories (id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_category_id
+    ON questions (category, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_category_difficulty
+    ON questions (category, difficulty);
+
+ANALYZE questions;
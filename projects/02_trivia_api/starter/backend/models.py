@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, DDL, create_engine, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -25,11 +25,24 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  # trigram indexes serve the substring search of POST /questions/search;
+  # existing databases get them from migrations/0001_question_search_indexes.sql.
+  # the category indexes serve the category listing and the quiz filters;
+  # existing databases get them from migrations/0002_question_category_foreign_key.sql
+  __table_args__ = (
+    Index('ix_questions_category_id', 'category', 'id'),
+    Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    Index('ix_questions_question_trgm', 'question',
+          postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'}),
+    Index('ix_questions_answer_trgm', 'answer',
+          postgresql_using='gin', postgresql_ops={'answer': 'gin_trgm_ops'}),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category',
+                                         onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -58,6 +71,10 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+event.listen(
+  Question.__table__, 'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 '''
 Category
 
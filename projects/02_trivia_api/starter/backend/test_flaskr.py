@@ -50,6 +50,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['categories'])
 
+    def test_category_question_counts_follow_new_questions(self):
+        before = json.loads(self.client().get('/categories').data)['question_counts']
+        self.question.insert()
+        after = json.loads(self.client().get('/categories').data)['question_counts']
+        self.question.delete()
+
+        self.assertEqual(after['3'], before['3'] + 1)
+
     def test_get_paginated_questions(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -70,6 +78,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["error"], 404)
         self.assertEqual(data["message"], "resource not found")
 
+    def test_get_questions_after_cursor(self):
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?after={}'.format(first['next_after']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], first['total_questions'])
+        self.assertTrue(all(q['id'] > first['next_after'] for q in data['current_questions']))
+        self.assertEqual(
+            data['current_questions'],
+            json.loads(self.client().get('/questions?page=2').data)['current_questions'])
+
     def test_delete_question(self):
         self.question.insert()
         question_id = self.question.id
@@ -109,6 +129,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data["current_questions"]))
         self.assertTrue(data["total_questions"])
 
+    def test_400_if_question_difficulty_is_not_a_number(self):
+        question = {
+            'question': self.question.question,
+            'answer': self.question.answer,
+            'category': '3',
+            'difficulty': 'hard'
+        }
+        res = self.client().post('/questions', json=question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
+    def test_bulk_add_questions_reports_invalid_rows(self):
+        lines = [
+            json.dumps({'question': 'bulk question?', 'answer': 'bulk',
+                        'category': 1, 'difficulty': 2}),
+            json.dumps({'question': 'bulk question?', 'answer': 'bulk',
+                        'category': 1000, 'difficulty': 2}),
+        ]
+        res = self.client().post('/questions/bulk', data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        Question.query.filter(Question.question == 'bulk question?').delete()
+        Question.query.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['rejected'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+        self.assertIn('category', data['errors'][0]['errors'])
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode().splitlines()
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(lines), total)
+        self.assertEqual(set(json.loads(lines[0])),
+                         {'id', 'question', 'answer', 'category', 'difficulty'})
+
     def test_405_if_question_adding_not_allowed(self):
         question = {
             'question': self.question.question,
@@ -137,6 +199,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "unprocessable")
 
+    def test_400_if_question_category_is_a_boolean(self):
+        question = {
+            'question': self.question.question,
+            'answer': self.question.answer,
+            'category': True,
+            'difficulty': self.question.difficulty
+        }
+        res = self.client().post('/questions', json=question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
+    def test_422_if_question_difficulty_is_out_of_range(self):
+        question = {
+            'question': self.question.question,
+            'answer': self.question.answer,
+            'category': self.question.category,
+            'difficulty': 9
+        }
+        res = self.client().post('/questions', json=question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
     def test_get_question_search_with_results(self):
         search = {"search": "penicillin"}
         res = self.client().post("/questions", json=search)
@@ -158,6 +246,33 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data["search_questions"]), 0)
         self.assertEqual(data["total_questions"], 0)
 
+    def test_search_questions_endpoint(self):
+        search = {"searchTerm": "title", "category": 5}
+        res = self.client().post("/questions/search", json=search)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["questions"]), 1)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(data["current_category"], "Entertainment")
+
+    def test_search_questions_matches_answers(self):
+        res = self.client().post("/questions/search", json={"searchTerm": "fleming"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(data["questions"][0]["answer"], "Alexander Fleming")
+
+    def test_400_if_search_term_is_missing(self):
+        res = self.client().post("/questions/search", json={"searchTerm": " "})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "bad request")
+
     def test_get_question_per_category(self):
         res = self.client().get("/categories/1/questions")
         data = json.loads(res.data)
@@ -189,6 +304,94 @@ class TriviaTestCase(unittest.TestCase):
         # of the same category I have selected
         self.assertEqual(data["question"]["category"], 6)
 
+    def test_get_quiz_skips_previous_questions(self):
+        posted_data = {
+            "previous_questions": [10],
+            "quiz_category": {"type": "Sports", "id": 6}
+        }
+        res = self.client().post("/quizzes", json=posted_data)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["question"]["id"], 11)
+
+    def test_get_quiz_returns_none_when_category_is_exhausted(self):
+        posted_data = {
+            "previous_questions": [10, 11],
+            "quiz_category": {"type": "Sports", "id": 6}
+        }
+        res = self.client().post("/quizzes", json=posted_data)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["question"], None)
+
+    def test_quiz_session_plays_every_question_once(self):
+        res = self.client().post("/quizzes/sessions", json={"quiz_category": {"type": "Sports", "id": 6}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data["success"], True)
+
+        played = []
+        while True:
+            res = self.client().post("/quizzes/sessions/{}/next".format(data["session_id"]))
+            question = json.loads(res.data)["question"]
+            if question is None:
+                break
+            self.assertEqual(question["category"], 6)
+            played.append(question["id"])
+
+        self.assertEqual(sorted(played), [10, 11])
+
+    def test_404_next_question_of_unknown_quiz_session(self):
+        res = self.client().post("/quizzes/sessions/unknown/next")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "resource not found")
+
+    def test_sample_quiz_question_by_difficulty(self):
+        posted_data = {
+            "categories": [5, 6],
+            "difficulty_weights": {"4": 1},
+            "previous_questions": [2]
+        }
+        res = self.client().post("/quizzes/sample", json=posted_data)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertIn(data["question"]["id"], [4, 11])
+        self.assertEqual(data["question"]["difficulty"], 4)
+
+    def test_sample_quiz_question_inserted_with_string_fields(self):
+        # the first draw loads the pools, so the insert has to update them
+        self.client().post("/quizzes/sample", json={"categories": [6]})
+        question = Question(question='string fields?', answer='yes', category='6', difficulty='4')
+        question.insert()
+        question_id = question.id
+
+        posted_data = {
+            "categories": [6],
+            "difficulty_weights": {"4": 1},
+            "previous_questions": [11]
+        }
+        res = self.client().post("/quizzes/sample", json=posted_data)
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["question"]["id"], question_id)
+
+    def test_400_sample_quiz_question_of_unknown_category(self):
+        res = self.client().post("/quizzes/sample", json={"categories": [1000]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
     def test_400_post_invalid_category_for_quiz(self):
         posted_data = {"previous_questions": [], "id": ""}  # "quiz_category": {"type": "",
         res = self.client().post("/quizzes", json=posted_data)